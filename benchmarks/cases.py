@@ -0,0 +1,290 @@
+import datetime as dt
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import reference
+from benchmarks.synthetic import (
+    correlated_returns, make_history_json, make_price_frames, make_tickers
+)
+from loaders.moex_loader import fetch_history_arrays, fetch_many, flatten, get_moex_data_and_prepare
+from loaders.universe import clear_universe_cache, get_securities_info, get_universe
+from portfolio.constructor import build_portfolio_df
+from portfolio.covariance import clear_covariance_cache, estimate_covariance
+from portfolio.monte_carlo import simulate_portfolio_var
+from portfolio.optimizer import efficient_frontier, optimize_portfolio_weights
+from portfolio.risk_return import calc_batch_metrics
+from portfolio.var_analysis import perform_var_analysis
+from portfolio.var_backtest import backtest_var
+from portfolio.walk_forward import walk_forward_backtest
+
+# Модули интерфейса импортируются так же, как при запуске streamlit run streamlit_app/app.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'streamlit_app'))
+from chart_data import histogram_bins, lttb, minmax_indices
+from ui import prepare_heatmap_data
+
+# Сценарии замеров: имя → параметры по масштабам (small/medium/large) и функция подготовки.
+# Подготовка получает заглушку ISS и параметры масштаба и возвращает функцию без
+# аргументов, время которой измеряется. Данные создаются в подготовке и в замер не входят.
+# baseline — имя сценария, относительно которого на том же масштабе считается ускорение
+# (прежняя реализация или запуск в один процесс).
+CASES = {}
+SCALES = ('small', 'medium', 'large')
+
+
+def case(name, small, medium, large, baseline=None):
+    def decorator(setup):
+        CASES[name] = {'setup': setup, 'scales': {'small': small, 'medium': medium, 'large': large},
+                       'baseline': baseline}
+        return setup
+    return decorator
+
+
+# Число процессов для замеров масштабирования: 1, 2, 4, … и все ядра машины
+def worker_counts(max_workers=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 < max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+    return counts
+
+
+def _window(years):
+    end = dt.date.today() - dt.timedelta(days=1)
+    return end - dt.timedelta(days=int(365.25 * years)), end
+
+
+def _panel_df(n_tickers, years, missing='random'):
+    tickers = make_tickers(n_tickers)
+    frames = make_price_frames(tickers, years=years, missing=missing)
+    weights = np.full(n_tickers, 1.0 / n_tickers)
+    return tickers, weights, build_portfolio_df(frames, tickers, weights)
+
+
+@case('flatten', small={'years': 1}, medium={'years': 5}, large={'years': 10})
+def _flatten(server, years):
+    start, end = _window(years)
+    j = make_history_json('SBER', start, end)
+    return lambda: flatten(j, 'history')
+
+
+# Потоковая загрузка одного окна с постраничным курсором (страница — 100 строк)
+@case('fetch_history_arrays', small={'years': 1}, medium={'years': 5}, large={'years': 10})
+def _fetch_history_arrays(server, years):
+    start, end = _window(years)
+    return lambda: fetch_history_arrays('SBER', start, end)
+
+
+@case('get_moex_data_and_prepare', small={'years': 1}, medium={'years': 3}, large={'years': 10},
+      baseline='get_moex_data_and_prepare_ref')
+def _get_moex_data_and_prepare(server, years):
+    start, end = _window(years)
+    return lambda: get_moex_data_and_prepare('SBER', start, end, use_cache=False)
+
+
+# Прежний путь через ту же заглушку: все колонки, flatten() и DataFrame из словарей.
+# Сравнение времени и памяти (--memory) с потоковой загрузкой в массивы
+@case('get_moex_data_and_prepare_ref', small={'years': 1}, medium={'years': 3}, large={'years': 10})
+def _get_moex_data_and_prepare_ref(server, years):
+    start, end = _window(years)
+    return lambda: reference.get_moex_data_and_prepare('SBER', start, end)
+
+
+# Повторный запрос того же окна: данные берутся из локального кэша котировок
+@case('get_moex_data_and_prepare_cached', small={'years': 1}, medium={'years': 3}, large={'years': 10})
+def _get_moex_data_and_prepare_cached(server, years):
+    start, end = _window(years)
+    get_moex_data_and_prepare('GAZP', start, end)
+    return lambda: get_moex_data_and_prepare('GAZP', start, end)
+
+
+# Параллельная загрузка нескольких тикеров; задержка ответа заглушки имитирует сеть
+@case('fetch_many',
+      small={'tickers': 1, 'years': 1, 'latency': 0.02},
+      medium={'tickers': 10, 'years': 1, 'latency': 0.02},
+      large={'tickers': 50, 'years': 1, 'latency': 0.02})
+def _fetch_many(server, tickers, years, latency):
+    start, end = _window(years)
+    secids = make_tickers(tickers)
+    server.latency = latency
+    return lambda: fetch_many(secids, start, end, use_cache=False)
+
+
+# Загрузка с определением режима торгов и диапазона истории каждой бумаги
+@case('fetch_many_resolved',
+      small={'tickers': 1, 'years': 1, 'latency': 0.02},
+      medium={'tickers': 10, 'years': 1, 'latency': 0.02},
+      large={'tickers': 50, 'years': 1, 'latency': 0.02})
+def _fetch_many_resolved(server, tickers, years, latency):
+    start, end = _window(years)
+    secids = make_tickers(tickers)
+    server.latency = latency
+
+    def run():
+        clear_universe_cache()
+        return fetch_many(secids, start, end, use_cache=False, resolve=True)
+    return run
+
+
+# Полный список бумаг (страницы по 100) и режимы торгов без кэша
+@case('universe', small={'tickers': 100}, medium={'tickers': 250}, large={'tickers': 1000})
+def _universe(server, tickers):
+    server.httpd.universe_size = tickers
+
+    def run():
+        clear_universe_cache()
+        get_securities_info(get_universe()['secid'])
+    return run
+
+
+@case('build_portfolio_df',
+      small={'tickers': 5, 'years': 1},
+      medium={'tickers': 50, 'years': 5},
+      large={'tickers': 200, 'years': 10})
+def _build_portfolio_df(server, tickers, years):
+    secids = make_tickers(tickers)
+    frames = make_price_frames(secids, years=years, missing='random')
+    weights = np.full(tickers, 1.0 / tickers)
+    return lambda: build_portfolio_df(frames, secids, weights)
+
+
+def _var_returns(points):
+    return pd.DataFrame({'Portfolio_Return': correlated_returns(points, 1)[:, 0]})
+
+
+def _perform_var_analysis(server, points, window):
+    df = _var_returns(points)
+    return lambda: perform_var_analysis(df, ma_window=window)
+
+
+# Прежний расчёт скользящих VaR через rolling().apply (на large — минуты на вызов)
+def _perform_var_analysis_reference(server, points, window):
+    df = _var_returns(points)
+    return lambda: reference.perform_var_analysis(df, ma_window=window)
+
+
+# perform_var_analysis для нескольких длин окна; ускорение — относительно rolling().apply
+for _ma_window in (20, 50, 250):
+    _scales = {scale: {'points': points, 'window': _ma_window}
+               for scale, points in zip(SCALES, (10_000, 100_000, 1_000_000))}
+    case(f'perform_var_analysis_w{_ma_window}', **_scales,
+         baseline=f'perform_var_analysis_ref_w{_ma_window}')(_perform_var_analysis)
+    case(f'perform_var_analysis_ref_w{_ma_window}', **_scales)(_perform_var_analysis_reference)
+
+
+@case('backtest_var',
+      small={'points': 2_000, 'portfolios': 1},
+      medium={'points': 10_000, 'portfolios': 1},
+      large={'points': 10_000, 'portfolios': 10})
+def _backtest_var(server, points, portfolios):
+    returns = pd.DataFrame(correlated_returns(points, portfolios))
+    return lambda: backtest_var(returns)
+
+
+@case('optimize_portfolio_weights', small={'assets': 10}, medium={'assets': 50}, large={'assets': 200})
+def _optimize_portfolio_weights(server, assets):
+    tickers, weights, port_df = _panel_df(assets, 3)
+    mean_returns = port_df[[f"{t}_Daily_Return" for t in tickers]].mean().to_numpy()
+    cov = estimate_covariance(port_df, tickers)
+    return lambda: optimize_portfolio_weights(mean_returns, cov, target_volatility=0.20, init_guess=weights)
+
+
+def _frontier_inputs(assets, points):
+    tickers, weights, port_df = _panel_df(assets, 3)
+    mean_returns = port_df[[f"{t}_Daily_Return" for t in tickers]].mean().to_numpy()
+    return mean_returns, estimate_covariance(port_df, tickers), np.linspace(0.10, 0.40, points), weights
+
+
+@case('efficient_frontier',
+      small={'assets': 10, 'points': 20},
+      medium={'assets': 50, 'points': 20},
+      large={'assets': 200, 'points': 20},
+      baseline='efficient_frontier_reference')
+def _efficient_frontier(server, assets, points):
+    mean_returns, cov, targets, weights = _frontier_inputs(assets, points)
+    return lambda: efficient_frontier(mean_returns, cov, targets, init_guess=weights)
+
+
+# Та же сетка прежним способом: SLSQP на каждую точку с численными градиентами, без тёплого старта
+@case('efficient_frontier_reference',
+      small={'assets': 10, 'points': 20},
+      medium={'assets': 50, 'points': 20},
+      large={'assets': 200, 'points': 20})
+def _efficient_frontier_reference(server, assets, points):
+    mean_returns, cov, targets, _ = _frontier_inputs(assets, points)
+    return lambda: reference.efficient_frontier(mean_returns, cov.matrix, targets)
+
+
+@case('estimate_covariance',
+      small={'assets': 10, 'estimator': 'ledoit_wolf'},
+      medium={'assets': 50, 'estimator': 'ledoit_wolf'},
+      large={'assets': 200, 'estimator': 'ledoit_wolf'})
+def _estimate_covariance(server, assets, estimator):
+    tickers, _, port_df = _panel_df(assets, 3)
+
+    def run():
+        clear_covariance_cache()
+        return estimate_covariance(port_df, tickers, estimator)
+    return run
+
+
+@case('heatmap_prep', small={'tickers': 10}, medium={'tickers': 50}, large={'tickers': 250})
+def _heatmap_prep(server, tickers):
+    _, _, port_df = _panel_df(tickers, 3)
+    return lambda: prepare_heatmap_data(port_df)
+
+
+# Прореживание ряда для графика до 2000 точек (без кэша chart_data)
+@case('chart_decimation', small={'points': 10_000}, medium={'points': 100_000}, large={'points': 1_000_000})
+def _chart_decimation(server, points):
+    y = np.cumsum(correlated_returns(points, 1)[:, 0])
+    x = np.arange(points, dtype=float)
+
+    def run():
+        lttb(x, y, 2000)
+        minmax_indices(y, 2000)
+        histogram_bins(y, 50)
+    return run
+
+
+@case('calc_batch_metrics',
+      small={'portfolios': 100, 'assets': 20},
+      medium={'portfolios': 1_000, 'assets': 20},
+      large={'portfolios': 10_000, 'assets': 20})
+def _calc_batch_metrics(server, portfolios, assets):
+    returns = correlated_returns(750, assets)
+    weights = np.random.default_rng(0).dirichlet(np.ones(assets), portfolios)
+    return lambda: calc_batch_metrics(returns, weights)
+
+
+@case('simulate_portfolio_var',
+      small={'paths': 10_000, 'assets': 20, 'workers': 1},
+      medium={'paths': 100_000, 'assets': 20, 'workers': 1},
+      large={'paths': 1_000_000, 'assets': 20, 'workers': None})
+def _simulate_portfolio_var(server, paths, assets, workers):
+    tickers, weights, port_df = _panel_df(assets, 3)
+    return lambda: simulate_portfolio_var(port_df, tickers, weights, n_paths=paths, n_workers=workers, seed=0)
+
+
+# Масштабирование Monte Carlo по числу процессов при фиксированном числе путей:
+# сценарий на каждое число процессов, ускорение — относительно одного процесса
+for _workers in worker_counts():
+    case(f'simulate_portfolio_var_workers_{_workers}',
+         small={'paths': 1_000_000, 'assets': 20, 'workers': _workers},
+         medium={'paths': 2_000_000, 'assets': 20, 'workers': _workers},
+         large={'paths': 4_000_000, 'assets': 20, 'workers': _workers},
+         baseline='simulate_portfolio_var_workers_1' if _workers > 1 else None)(_simulate_portfolio_var)
+
+
+# Walk-forward с ежемесячной ребалансировкой и скользящим окном 252 дня
+@case('walk_forward_backtest',
+      small={'assets': 10, 'years': 3},
+      medium={'assets': 50, 'years': 10},
+      large={'assets': 200, 'years': 10})
+def _walk_forward_backtest(server, assets, years):
+    tickers, _, port_df = _panel_df(assets, years)
+    return lambda: walk_forward_backtest(port_df, tickers, target_volatility=0.25)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from scipy.stats import norm
+
+from loaders.moex_loader import get_moex_stock_data, prepare_price_df
+from portfolio.var_analysis import calculate_p_value
+
+# Прежние реализации, с которыми сравниваются текущие в сценариях с baseline.
+# Код перенесён без изменений логики; используется только в замерах.
+
+
+# Оптимизация до эффективной границы: численные градиенты SLSQP, ковариация целиком,
+# старт всегда из равных весов
+def optimize_portfolio_weights(mean_returns_daily, cov_matrix_daily,
+                               target_volatility=0.20, init_guess=None):
+    num_assets = len(mean_returns_daily)
+
+    mu = mean_returns_daily * 252
+    sigma = cov_matrix_daily * 252
+
+    def neg_portfolio_return(weights):
+        return -np.dot(weights, mu)
+
+    def risk_constraint(weights):
+        return target_volatility**2 - np.dot(weights.T, np.dot(sigma, weights))
+
+    constraints = [
+        {'type': 'eq', 'fun': lambda x: np.sum(x) - 1},
+        {'type': 'ineq', 'fun': risk_constraint}
+    ]
+
+    bounds = [(0, 1) for _ in range(num_assets)]
+
+    if init_guess is None:
+        init_guess = np.array([1.0 / num_assets] * num_assets)
+
+    result = minimize(
+        neg_portfolio_return,
+        init_guess,
+        method='SLSQP',
+        bounds=bounds,
+        constraints=constraints
+    )
+
+    if not result.success:
+        raise ValueError("Оптимизация не удалась, попробуй повысить уровень годовой волатильности")
+
+    return result.x, -result.fun
+
+
+# Эффективная граница прежним способом: отдельная оптимизация на каждую точку сетки
+def efficient_frontier(mean_returns_daily, cov_matrix_daily, target_volatilities):
+    weights = np.full((len(target_volatilities), len(mean_returns_daily)), np.nan)
+    for i, target in enumerate(target_volatilities):
+        try:
+            weights[i], _ = optimize_portfolio_weights(mean_returns_daily, cov_matrix_daily, target)
+        except ValueError:
+            pass
+    return weights
+
+
+def delta_normal_var(returns, confidence_level=0.95):
+    mean = np.mean(returns)
+    std_dev = np.std(returns)
+    return norm.ppf(1 - confidence_level, mean, std_dev)
+
+
+# Расчёт VaR до векторизации: скользящие VaR через rolling().apply
+# с вызовом Python-функции на каждое окно
+def perform_var_analysis(df, ma_window=50):
+    df = df.copy()
+
+    df['MA'] = df['Portfolio_Return'].rolling(window=ma_window).mean()
+    df['EWMA'] = df['Portfolio_Return'].ewm(span=ma_window, adjust=False).mean()
+
+    df['Delta-Normal VaR'] = df['Portfolio_Return'].rolling(window=ma_window).apply(delta_normal_var)
+    df['Var Historical'] = df['Portfolio_Return'].rolling(window=ma_window).apply(lambda x: np.percentile(x, 5))
+
+    violations_ma = (df['Portfolio_Return'] < df['Delta-Normal VaR']).sum()
+    violations_hist = (df['Portfolio_Return'] < df['Var Historical']).sum()
+    n_observations = len(df)
+
+    p_value_ma = calculate_p_value(violations_ma, n_observations)
+    p_value_hist = calculate_p_value(violations_hist, n_observations)
+
+    df['Squared Returns'] = df['Portfolio_Return'] ** 2
+    df['EWMA Variance'] = df['Squared Returns'].ewm(alpha=(1 - 0.94)).mean()
+    df['EWMA Volatility'] = np.sqrt(df['EWMA Variance'])
+    df['r/σ_EWMA'] = df['Portfolio_Return'] / df['EWMA Volatility']
+
+    results = {
+        'Violations, Delta-Normal VaR': violations_ma,
+        'Violations, Historical VaR': violations_hist,
+        'Observations': n_observations,
+        'Expected Violations (5%)': n_observations * 0.05,
+        'p-value, Delta-Normal VaR': p_value_ma,
+        'p-value, Historical VaR': p_value_hist
+    }
+
+    return df, results, ma_window
+
+
+# Загрузка без кэша до потоковых массивов: все колонки истории, строки — словари
+# flatten(), затем DataFrame из списка словарей
+def get_moex_data_and_prepare(secid, start_date, end_date):
+    return prepare_price_df(secid, pd.DataFrame(get_moex_stock_data(secid, start_date, end_date)))
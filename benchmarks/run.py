@@ -0,0 +1,212 @@
+# Замеры производительности на синтетических данных MOEX.
+#
+# Запуск (из корня репозитория):
+#   python -m benchmarks.run --scales small medium --output results.json
+#   python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.2
+#
+# Загрузчики работают с локальной заглушкой ISS (benchmarks.synthetic.StubISSServer)
+# и временным кэшем котировок, сеть не используется. При --compare код возврата 1,
+# если хотя бы один сценарий медленнее базового больше чем на threshold.
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import MISSING_PATTERNS, StubISSServer
+
+
+# Настраивает окружение загрузчиков до их импорта: адрес заглушки, временный кэш,
+# отключённый лимит запросов
+def _configure_environment(server, cache_dir):
+    os.environ['MOEX_ISS_URL'] = server.url
+    os.environ['MOEX_CACHE_PATH'] = os.path.join(cache_dir, 'prices.sqlite')
+    os.environ['MOEX_ISS_RATE'] = '0'
+
+
+def _metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import numpy as np
+    import pandas as pd
+    import scipy
+    return {
+        'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'scipy': scipy.__version__,
+    }
+
+
+# Время одного сценария: прогревочный вызов, затем до repeat замеров,
+# но не дольше max_time секунд (минимум один замер)
+def time_case(func, repeat=5, max_time=10.0, memory=False):
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+        timings = []
+        started = time.perf_counter()
+        while len(timings) < repeat and (not timings or time.perf_counter() - started < max_time):
+            t0 = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - t0)
+
+        peak = None
+        if memory:
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return {
+        'repeats': len(timings),
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'peak_bytes': peak,
+    }
+
+
+def run_benchmarks(cases, server, names=None, scales=('small', 'medium'), repeat=5, max_time=10.0, memory=False):
+    results = []
+    for name in names or list(cases):
+        if name not in cases:
+            raise KeyError(f"Неизвестный сценарий: {name}")
+        for scale in scales:
+            params = cases[name]['scales'][scale]
+            server.latency = 0.0
+            with contextlib.redirect_stdout(io.StringIO()):
+                func = cases[name]['setup'](server, **params)
+            stats = time_case(func, repeat, max_time, memory)
+            results.append({'case': name, 'scale': scale, 'params': params, **stats})
+            peak = f"  пик {stats['peak_bytes'] / 2 ** 20:8.2f} MiB" if stats['peak_bytes'] is not None else ""
+            print(f"{name:<34} {scale:<7} median {stats['median'] * 1e3:10.2f} ms"
+                  f"  min {stats['min'] * 1e3:10.2f} ms  ({stats['repeats']} повт.){peak}")
+    return results
+
+
+# Ускорение относительно базового сценария (case(..., baseline=...)) на том же масштабе:
+# время базового / время сценария; в результаты добавляются baseline_case и speedup,
+# при замере памяти — memory_ratio (пик базового / пик сценария)
+def add_speedups(results, cases):
+    by_key = {(r['case'], r['scale']): r for r in results}
+    for r in results:
+        base = by_key.get((cases[r['case']].get('baseline'), r['scale']))
+        if base is None:
+            continue
+        r['baseline_case'] = base['case']
+        r['speedup'] = base['median'] / r['median']
+        if base['peak_bytes'] and r['peak_bytes']:
+            r['memory_ratio'] = base['peak_bytes'] / r['peak_bytes']
+    return results
+
+
+def print_speedups(results):
+    rows = [r for r in results if 'speedup' in r]
+    if not rows:
+        return
+    print(f"\n{'Сценарий':<34} {'масштаб':<7} {'относительно':<34} {'ускорение':>9} {'память':>8}")
+    for r in rows:
+        memory = f"{r['memory_ratio']:7.2f}x" if 'memory_ratio' in r else f"{'—':>8}"
+        print(f"{r['case']:<34} {r['scale']:<7} {r['baseline_case']:<34} {r['speedup']:8.2f}x {memory}")
+
+
+# Сравнение с базовым прогоном по метрике (median/min): ratio = текущее / базовое.
+# Статус regression — медленнее больше чем на threshold, improvement — быстрее.
+def compare_results(results, baseline, threshold=0.2, metric='median'):
+    base = {(r['case'], r['scale']): r for r in baseline['results']}
+    rows = []
+    for r in results:
+        b = base.get((r['case'], r['scale']))
+        if b is None:
+            rows.append({'case': r['case'], 'scale': r['scale'], 'current': r[metric],
+                         'baseline': None, 'ratio': None, 'status': 'new'})
+            continue
+        ratio = r[metric] / b[metric] if b[metric] else float('inf')
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 - threshold:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append({'case': r['case'], 'scale': r['scale'], 'current': r[metric],
+                     'baseline': b[metric], 'ratio': ratio, 'status': status})
+    return rows
+
+
+def print_comparison(rows):
+    print(f"\n{'Сценарий':<34} {'масштаб':<7} {'база, ms':>10} {'сейчас, ms':>11} {'x':>6}  статус")
+    for row in rows:
+        base = f"{row['baseline'] * 1e3:10.2f}" if row['baseline'] is not None else f"{'—':>10}"
+        ratio = f"{row['ratio']:6.2f}" if row['ratio'] is not None else f"{'—':>6}"
+        print(f"{row['case']:<34} {row['scale']:<7} {base} {row['current'] * 1e3:11.2f} {ratio}  {row['status']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности на синтетических данных MOEX")
+    parser.add_argument('--cases', nargs='*', help="имена сценариев (по умолчанию все)")
+    parser.add_argument('--scales', nargs='*', default=['small', 'medium'],
+                        choices=('small', 'medium', 'large'))
+    parser.add_argument('--repeat', type=int, default=5, help="число замеров на сценарий")
+    parser.add_argument('--max-time', type=float, default=10.0, help="предел времени замеров сценария, с")
+    parser.add_argument('--memory', action='store_true', help="пиковая память (tracemalloc), отдельный вызов")
+    parser.add_argument('--output', default='benchmark_results.json', help="файл результатов JSON")
+    parser.add_argument('--compare', help="JSON базового прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимое замедление (доля)")
+    parser.add_argument('--metric', choices=('median', 'min'), default='median')
+    parser.add_argument('--missing', choices=MISSING_PATTERNS, default='none',
+                        help="пропуски торговых дней в ответах заглушки ISS")
+    parser.add_argument('--list', action='store_true', help="показать сценарии и выйти")
+    args = parser.parse_args(argv)
+
+    server = StubISSServer(missing=args.missing).start()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        _configure_environment(server, cache_dir)
+        from benchmarks.cases import CASES
+
+        if args.list:
+            for name, spec in CASES.items():
+                print(name, {scale: params for scale, params in spec['scales'].items()})
+            server.stop()
+            return 0
+
+        results = run_benchmarks(CASES, server, args.cases, args.scales, args.repeat, args.max_time, args.memory)
+        add_speedups(results, CASES)
+    server.stop()
+    print_speedups(results)
+
+    report = {'meta': _metadata(), 'results': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare_results(results, baseline, args.threshold, args.metric)
+        print_comparison(rows)
+        regressions = [r for r in rows if r['status'] == 'regression']
+        if regressions:
+            print(f"\nСценариев с замедлением больше {args.threshold:.0%}: {len(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
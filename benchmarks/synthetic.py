@@ -0,0 +1,233 @@
+import datetime as dt
+import functools
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+# Колонки истории ISS (подмножество реального ответа)
+HISTORY_COLUMNS = ('BOARDID', 'TRADEDATE', 'SHORTNAME', 'SECID', 'NUMTRADES', 'VALUE',
+                   'OPEN', 'LOW', 'HIGH', 'LEGALCLOSEPRICE', 'WAPRICE', 'CLOSE', 'VOLUME')
+
+# Начало синтетической истории: ряды всех тикеров строятся от этой даты,
+# поэтому ответы на пересекающиеся окна согласованы между собой
+ORIGIN = dt.date(2005, 1, 3)
+
+MISSING_PATTERNS = ('none', 'random', 'blocks')
+
+
+def _seed(secid, seed=0):
+    return zlib.crc32(secid.encode()) + seed
+
+
+# Коррелированные дневные доходности (T, N): однофакторная модель с корреляцией corr
+# между любыми двумя активами и дневной волатильностью vol
+def correlated_returns(n_days, n_tickers, corr=0.3, vol=0.02, drift=0.0003, seed=0):
+    rng = np.random.default_rng(seed)
+    market = rng.standard_normal((n_days, 1))
+    idio = rng.standard_normal((n_days, n_tickers))
+    return drift + vol * (np.sqrt(corr) * market + np.sqrt(1 - corr) * idio)
+
+
+# Маска пропущенных торговых дней: 'random' — отдельные дни с долей fraction,
+# 'blocks' — блоки подряд (праздники, приостановка торгов) той же суммарной доли
+def missing_mask(n_days, pattern='none', fraction=0.02, block=5, seed=0):
+    if pattern not in MISSING_PATTERNS:
+        raise ValueError(f"Неизвестный шаблон пропусков: {pattern}")
+    mask = np.zeros(n_days, dtype=bool)
+    if pattern == 'none' or fraction <= 0:
+        return mask
+
+    rng = np.random.default_rng(seed)
+    if pattern == 'random':
+        mask[rng.random(n_days) < fraction] = True
+    else:
+        n_blocks = max(1, int(n_days * fraction / block))
+        for start in rng.integers(0, max(1, n_days - block), n_blocks):
+            mask[start:start + block] = True
+    mask[0] = False
+    return mask
+
+
+# Рабочие дни окна [start, end]
+def business_days(start_date, end_date):
+    return pd.bdate_range(start_date, end_date)
+
+
+# Цены закрытия одного тикера на рабочих днях от ORIGIN до сегодняшнего дня
+@functools.lru_cache(maxsize=256)
+def ticker_history(secid, missing='none', fraction=0.02, seed=0):
+    days = business_days(ORIGIN, dt.date.today())
+    rng = np.random.default_rng(_seed(secid, seed))
+    returns = 0.0003 + 0.02 * rng.standard_normal(len(days))
+    closes = np.round(100 * np.exp(np.cumsum(returns)), 2)
+    keep = ~missing_mask(len(days), missing, fraction, seed=_seed(secid, seed))
+    return days[keep], closes[keep]
+
+
+# Строки истории ISS по датам и ценам закрытия (все колонки HISTORY_COLUMNS)
+def history_rows(secid, dates, closes, board='TQBR'):
+    return [
+        [board, d.strftime('%Y-%m-%d'), secid, secid, 1000, c * 1e4,
+         c, c * 0.99, c * 1.01, c, c, c, 1e4]
+        for d, c in zip(dates, closes.tolist())
+    ]
+
+
+# Ответ ISS history в формате JSON (без meta): блок history и курсор history.cursor
+def make_history_json(secid, start_date, end_date, columns=HISTORY_COLUMNS, start=0, page_size=None,
+                      missing='none', fraction=0.02, seed=0):
+    dates, closes = ticker_history(secid, missing, fraction, seed)
+    window = (dates >= pd.Timestamp(start_date)) & (dates <= pd.Timestamp(end_date))
+    rows = history_rows(secid, dates[window], closes[window])
+
+    if tuple(columns) != HISTORY_COLUMNS:
+        idx = [HISTORY_COLUMNS.index(c) for c in columns]
+        rows = [[r[i] for i in idx] for r in rows]
+
+    total = len(rows)
+    page_size = page_size or max(total, 1)
+    return {
+        'history': {'columns': list(columns), 'data': rows[start:start + page_size]},
+        'history.cursor': {'columns': ['INDEX', 'TOTAL', 'PAGESIZE'], 'data': [[start, total, page_size]]},
+    }
+
+
+# DataFrame в формате prepare_price_df для каждого тикера: {t}_Stock_Price и {t}_Daily_Return
+def make_price_frames(tickers, years=1, corr=0.3, missing='none', fraction=0.02, seed=0, end_date=None):
+    end_date = end_date or dt.date.today()
+    days = business_days(end_date - dt.timedelta(days=int(365.25 * years)), end_date)
+    returns = correlated_returns(len(days), len(tickers), corr=corr, seed=seed)
+    prices = 100 * np.exp(np.cumsum(returns, axis=0))
+
+    frames = []
+    for i, t in enumerate(tickers):
+        keep = ~missing_mask(len(days), missing, fraction, seed=seed + i)
+        df = pd.DataFrame({f'{t}_Stock_Price': prices[keep, i]}, index=days[keep])
+        df.index.name = 'TRADEDATE'
+        df = df.asfreq('B').ffill()
+        df[f'{t}_Daily_Return'] = df[f'{t}_Stock_Price'].pct_change()
+        frames.append(df.dropna())
+    return frames
+
+
+def make_tickers(n):
+    return [f"T{i:03d}" for i in range(n)]
+
+
+# Ответ ISS /securities.json: страница списка бумаг рынка (синтетические тикеры T000…)
+def make_securities_json(n_tickers, columns, start=0, limit=100):
+    rows = [
+        {'secid': t, 'shortname': f"Бумага {t}", 'name': f"ПАО Бумага {t}", 'isin': f"RU000{t}", 'type': 'common_share',
+         'group': 'stock_shares', 'primary_boardid': 'TQBR', 'is_traded': 1}
+        for t in make_tickers(n_tickers)[start:start + limit]
+    ]
+    return {'securities': {'columns': list(columns), 'data': [[r.get(c) for c in columns] for r in rows]}}
+
+
+# Ответ ISS /securities/{secid}.json: блок boards с основным режимом TQBR и диапазоном
+# синтетической истории тикера, плюс неосновной режим SMAL без истории
+def make_boards_json(secid, columns, missing='none'):
+    dates, _ = ticker_history(secid, missing)
+    boards = [
+        {'secid': secid, 'boardid': 'TQBR', 'engine': 'stock', 'market': 'shares', 'is_primary': 1, 'is_traded': 1,
+         'history_from': dates[0].strftime('%Y-%m-%d'), 'history_till': dates[-1].strftime('%Y-%m-%d')},
+        {'secid': secid, 'boardid': 'SMAL', 'engine': 'stock', 'market': 'shares', 'is_primary': 0, 'is_traded': 0,
+         'history_from': None, 'history_till': None},
+    ]
+    return {'boards': {'columns': list(columns), 'data': [[b.get(c) for c in columns] for b in boards]}}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        match = re.search(r'/securities/([^/]+)\.json$', url.path)
+        if url.path.endswith('/iss/securities.json'):
+            body = make_securities_json(
+                self.server.universe_size, query['securities.columns'][0].split(','),
+                start=int(query.get('start', ['0'])[0]), limit=int(query.get('limit', ['100'])[0]),
+            )
+        elif match and '/history/' not in url.path:
+            body = make_boards_json(match.group(1), query['boards.columns'][0].split(','), self.server.missing)
+        elif match:
+            columns = query.get('history.columns', [','.join(HISTORY_COLUMNS)])[0].split(',')
+            body = make_history_json(
+                match.group(1), query['from'][0], query['till'][0], columns=columns,
+                start=int(query.get('start', ['0'])[0]), page_size=self.server.page_size,
+                missing=self.server.missing,
+            )
+            limit = self.server.history_limit
+            if limit is not None:
+                start = int(query.get('start', ['0'])[0])
+                body['history']['data'] = body['history']['data'][:max(0, limit - start)]
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body).encode()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        # Счётчик увеличивается до ответа: клиент, получивший ответ, видит свой запрос учтённым
+        with self.server.lock:
+            self.server.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+# Локальный сервер, отвечающий на запросы history (с постраничным курсором), списка бумаг
+# /securities.json (universe_size тикеров) и режимов торгов бумаги в формате ISS.
+# Используется как MOEX_ISS_URL для замеров загрузчиков и тестов без сети; latency — искусственная
+# задержка ответа (с), чтобы параллельная загрузка вела себя как с настоящим ISS;
+# history_limit — сколько строк истории отдавать, дальше пустые страницы при полном TOTAL
+# (обрыв выдачи ISS).
+class StubISSServer:
+    def __init__(self, page_size=100, missing='none', latency=0.0, port=0, universe_size=250, history_limit=None):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), _StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.page_size = page_size
+        self.httpd.missing = missing
+        self.httpd.latency = latency
+        self.httpd.universe_size = universe_size
+        self.httpd.history_limit = history_limit
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/iss"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def latency(self):
+        return self.httpd.latency
+
+    @latency.setter
+    def latency(self, value):
+        self.httpd.latency = value
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
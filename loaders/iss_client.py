@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+
+import requests as req
+from requests.adapters import HTTPAdapter
+
+from profiling import instrumentation
+
+# Базовый адрес ISS (переопределяется, например, для локального тестового сервера)
+ISS_URL = os.environ.get("MOEX_ISS_URL", "https://iss.moex.com/iss")
+
+# Глобальный лимит запросов к ISS (запросов в секунду) и размер пула соединений
+ISS_RATE_LIMIT = float(os.environ.get("MOEX_ISS_RATE", "10"))
+ISS_POOL_SIZE = int(os.environ.get("MOEX_ISS_POOL", "16"))
+
+
+# Token bucket: не более rate запросов в секунду с допустимым всплеском burst
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            with instrumentation.stage('loaders.rate_limit_wait'):
+                time.sleep(wait)
+
+
+_session = None
+_session_lock = threading.Lock()
+rate_limiter = TokenBucket(ISS_RATE_LIMIT)
+
+
+# Общая сессия с пулом keep-alive соединений
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = req.Session()
+            adapter = HTTPAdapter(pool_connections=ISS_POOL_SIZE, pool_maxsize=ISS_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+
+# GET-запрос к ISS с ограничением частоты и повторами с экспоненциальной задержкой
+def iss_get_json(url, params=None, retries=3, backoff=0.5, timeout=30, encoding='utf-8'):
+    session = get_session()
+    for attempt in range(retries + 1):
+        rate_limiter.acquire()
+        started = time.perf_counter()
+        r = None
+        try:
+            r = session.get(url, params=params, timeout=timeout)
+            r.raise_for_status()
+            r.encoding = encoding
+            data = r.json()
+            instrumentation.record_http(url, time.perf_counter() - started, len(r.content))
+            return data
+        except (req.RequestException, ValueError) as e:
+            instrumentation.record_http(url, time.perf_counter() - started,
+                                        len(r.content) if r is not None else 0, ok=False)
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"Ошибка запроса {url}: {e}. Повтор через {delay:.1f} с")
+            time.sleep(delay)
@@ -0,0 +1,71 @@
+import datetime as dt
+import json
+import time
+
+from loaders.iss_client import ISS_URL, iss_get_json
+
+MARKETDATA_COLUMNS = ('SECID', 'LAST', 'SYSTIME')
+
+
+# Текущие котировки (последняя цена сделки) для списка бумаг одним запросом
+def fetch_marketdata(secids, engine='stock', market='shares', board='TQBR'):
+    url = f"{ISS_URL}/engines/{engine}/markets/{market}/boards/{board}/securities.json"
+    params = {
+        'iss.meta': 'off',
+        'iss.only': 'marketdata',
+        'securities': ','.join(secids),
+        'marketdata.columns': ','.join(MARKETDATA_COLUMNS),
+    }
+    block = iss_get_json(url, params=params).get('marketdata', {})
+    columns = block.get('columns', [])
+    if not all(c in columns for c in MARKETDATA_COLUMNS):
+        return {'time': None, 'date': None, 'prices': {}}
+
+    i_secid, i_last, i_time = (columns.index(c) for c in MARKETDATA_COLUMNS)
+    prices = {}
+    latest = None
+    for row in block.get('data', []):
+        if row[i_last] is not None:
+            prices[row[i_secid]] = row[i_last]
+        if row[i_time]:
+            latest = max(latest or row[i_time], row[i_time])
+
+    snapshot_time = dt.datetime.strptime(latest, "%Y-%m-%d %H:%M:%S") if latest else dt.datetime.now()
+    return {'time': snapshot_time, 'date': snapshot_time.date(), 'prices': prices}
+
+
+# Опрос endpoint marketdata с интервалом interval секунд; iterations=None — бесконечно.
+# Если record_path задан, каждый снимок дописывается в файл JSON Lines для последующего replay.
+def poll_marketdata(secids, interval=10, iterations=None, record_path=None, **board):
+    count = 0
+    while iterations is None or count < iterations:
+        started = time.monotonic()
+        try:
+            snapshot = fetch_marketdata(secids, **board)
+        except Exception as e:
+            print(f"Ошибка при запросе котировок: {e}")
+        else:
+            if record_path:
+                with open(record_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({**snapshot, 'time': snapshot['time'].isoformat(),
+                                        'date': snapshot['date'].isoformat()}) + '\n')
+            yield snapshot
+        count += 1
+        if iterations is None or count < iterations:
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+# Воспроизведение записанных снимков (файл JSON Lines или список словарей)
+def replay_marketdata(records):
+    if isinstance(records, str):
+        with open(records, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+
+    for record in records:
+        snapshot_time = record.get('time')
+        if isinstance(snapshot_time, str):
+            snapshot_time = dt.datetime.fromisoformat(snapshot_time)
+        snapshot_date = record.get('date') or snapshot_time.date()
+        if isinstance(snapshot_date, str):
+            snapshot_date = dt.date.fromisoformat(snapshot_date)
+        yield {'time': snapshot_time, 'date': snapshot_date, 'prices': record['prices']}
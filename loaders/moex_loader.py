@@ -1,13 +1,22 @@
-import requests as req
 import datetime as dt
+import numpy as np
 import pandas as pd
-import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loaders.iss_client import ISS_URL, iss_get_json
+from loaders.price_cache import get_price_cache
+from loaders.universe import clip_to_history, get_securities_info
+from profiling import instrumentation
+
+# Колонки истории, которые реально используются при подготовке данных
+HISTORY_COLUMNS = ('TRADEDATE', 'CLOSE')
 
 def flatten(j: dict, blockname: str):
     columns = j[blockname]['columns']
     return [{k: r[i] for i, k in enumerate(columns)} for r in j[blockname]['data']]
 
-def get_moex_stock_data(secid, start_date, end_date, engine='stock', market='shares', board='TQBR'):
+# Приводит границы окна к датам и проверяет их корректность
+def normalize_dates(start_date, end_date):
     # Преобразуем строки в даты
     if isinstance(start_date, str):
         start_date = dt.datetime.strptime(start_date, "%Y-%m-%d").date()
@@ -25,57 +34,229 @@ def get_moex_stock_data(secid, start_date, end_date, engine='stock', market='sha
         print(f"Начальная дата {start_date} позже конечной {end_date}. Меняем на год назад.")
         start_date = end_date - dt.timedelta(days=365)
 
-    all_data = []
-    current_start_date = start_date
+    return start_date, end_date
 
+# Разбивает окно на отрезки по 100 дней (ограничение ISS)
+def iter_chunks(start_date, end_date, days=100):
+    current_start_date = start_date
     while current_start_date <= end_date:
-        current_end_date = current_start_date + dt.timedelta(days=99)
-        if current_end_date > end_date:
-            current_end_date = end_date
+        current_end_date = min(current_start_date + dt.timedelta(days=days - 1), end_date)
+        yield current_start_date, current_end_date
+        current_start_date = current_end_date + dt.timedelta(days=1)
 
-        url = f"https://iss.moex.com/iss/history/engines/{engine}/markets/{market}/boards/{board}/securities/{secid}.json?from={current_start_date}&till={current_end_date}&iss.meta=off"
+def history_url(secid, start_date, end_date, engine='stock', market='shares', board='TQBR'):
+    return f"{ISS_URL}/history/engines/{engine}/markets/{market}/boards/{board}/securities/{secid}.json?from={start_date}&till={end_date}&iss.meta=off"
 
-        print(f"Запрос {secid}: {current_start_date} → {current_end_date}")
-        print(f"URL: {url}")
+# Загружает один отрезок истории; ошибки сети пробрасываются вызывающему коду
+def fetch_history_chunk(secid, start_date, end_date, engine='stock', market='shares', board='TQBR'):
+    url = history_url(secid, start_date, end_date, engine, market, board)
 
-        try:
-            r = req.get(url)
-            r.encoding = 'utf-8'
-            j = r.json()
+    print(f"Запрос {secid}: {start_date} → {end_date}")
+    print(f"URL: {url}")
 
-            if 'history' not in j or not j['history']['data']:
-                print(f"Нет данных по {secid} за период {current_start_date}–{current_end_date}")
-            else:
-                flattened_data = flatten(j, 'history')
-                all_data.extend(flattened_data)
+    j = iss_get_json(url)
+
+    if 'history' not in j or not j['history']['data']:
+        print(f"Нет данных по {secid} за период {start_date}–{end_date}")
+        return []
+    return flatten(j, 'history')
 
-            current_start_date = current_end_date + dt.timedelta(days=1)
-            time.sleep(0.5)
+# Параметры курсора ISS: (TOTAL, PAGESIZE); без курсора ответ считается одной страницей
+def history_cursor(j, n_rows):
+    cursor = j.get('history.cursor')
+    if not cursor or not cursor.get('data'):
+        return n_rows, n_rows
+    info = dict(zip(cursor['columns'], cursor['data'][0]))
+    return int(info.get('TOTAL', n_rows)), int(info.get('PAGESIZE', n_rows))
 
+# Потоковая загрузка отрезка истории: запрашиваются только TRADEDATE и CLOSE,
+# страницы history.cursor дописываются сразу в массивы NumPy без промежуточных словарей.
+# Третий элемент результата — прочитаны ли все TOTAL строк курсора: если ISS вернул
+# пустую страницу раньше, отрезок загружен не полностью и не должен попасть в покрытие кэша
+@instrumentation.timed('loaders.fetch_history')
+def fetch_history_window(secid, start_date, end_date, engine='stock', market='shares', board='TQBR'):
+    url = history_url(secid, start_date, end_date, engine, market, board)
+    params = {'iss.only': 'history,history.cursor', 'history.columns': ','.join(HISTORY_COLUMNS)}
+
+    print(f"Запрос {secid}: {start_date} → {end_date}")
+
+    dates = np.empty(0, dtype='datetime64[D]')
+    closes = np.empty(0, dtype=float)
+    filled = 0
+    while True:
+        j = iss_get_json(url, params={**params, 'start': filled})
+        block = j.get('history') or {}
+        page = block.get('data') or []
+        total, _ = history_cursor(j, filled + len(page))
+
+        n = len(page)
+        if filled + n > len(dates):
+            size = max(total, filled + n)
+            dates = np.resize(dates, size)
+            closes = np.resize(closes, size)
+        if n:
+            i_date = block['columns'].index('TRADEDATE')
+            i_close = block['columns'].index('CLOSE')
+            dates[filled:filled + n] = [r[i_date] for r in page]
+            closes[filled:filled + n] = [r[i_close] for r in page]
+            filled += n
+
+        if n == 0 or filled >= total:
+            break
+
+    if not filled:
+        print(f"Нет данных по {secid} за период {start_date}–{end_date}")
+    complete = filled >= total
+    if not complete:
+        print(f"Неполный ответ по {secid} за период {start_date}–{end_date}: {filled} из {total} строк")
+    return dates[:filled], closes[:filled], complete
+
+def fetch_history_arrays(secid, start_date, end_date, engine='stock', market='shares', board='TQBR'):
+    dates, closes, _ = fetch_history_window(secid, start_date, end_date, engine, market, board)
+    return dates, closes
+
+def get_moex_stock_data(secid, start_date, end_date, engine='stock', market='shares', board='TQBR'):
+    start_date, end_date = normalize_dates(start_date, end_date)
+
+    all_data = []
+    for current_start_date, current_end_date in iter_chunks(start_date, end_date):
+        try:
+            all_data.extend(fetch_history_chunk(secid, current_start_date, current_end_date, engine, market, board))
         except Exception as e:
             print(f"Ошибка при запросе данных {secid}: {e}")
             break
 
     return all_data
 
-def get_moex_data_and_prepare(secid, start_date, end_date):
-    data = get_moex_stock_data(secid, start_date, end_date)
+# Догружает в кэш только отсутствующие диапазоны дат; ошибка запроса пробрасывается
+# вызывающему — уже загруженные куски остаются в кэше
+def update_price_cache(secid, start_date, end_date, engine='stock', market='shares', board='TQBR', cache=None):
+    cache = cache or get_price_cache()
+    start_date, end_date = normalize_dates(start_date, end_date)
+
+    for gap_start, gap_end in cache.missing_ranges(secid, start_date, end_date, engine, market, board):
+        for current_start_date, current_end_date in iter_chunks(gap_start, gap_end):
+            dates, closes, complete = fetch_history_window(
+                secid, current_start_date, current_end_date, engine, market, board
+            )
+            cache.store(secid, close_rows(dates, closes), current_start_date, current_end_date,
+                        engine, market, board, cover=complete)
+
+def close_rows(dates, closes):
+    return zip(np.datetime_as_string(dates, unit='D'), closes.tolist())
 
-    if not data:
+# Склеивает массивы отрезков в DataFrame с колонками TRADEDATE и CLOSE
+def arrays_to_frame(chunks):
+    if not chunks:
+        return pd.DataFrame(columns=list(HISTORY_COLUMNS))
+    return pd.DataFrame({
+        'TRADEDATE': np.concatenate([dates for dates, _ in chunks]),
+        'CLOSE': np.concatenate([closes for _, closes in chunks]),
+    })
+
+# Загрузка нескольких тикеров: отрезки истории всех тикеров запрашиваются параллельно
+# через общий пул соединений, результат возвращается в порядке входного списка.
+# resolve=True — перед загрузкой определяются основной режим торгов и диапазон истории
+# каждой бумаги (loaders.universe), окно обрезается по нему, чтобы не запрашивать пустые
+# отрезки; если сведения получить не удалось, используется TQBR и окно целиком.
+@instrumentation.timed('loaders.fetch_many')
+def fetch_many(secids, start_date, end_date, max_workers=8, use_cache=True, resolve=False):
+    cache = get_price_cache() if use_cache else None
+    start_date, end_date = normalize_dates(start_date, end_date)
+    infos = get_securities_info(secids, max_workers=max_workers) if resolve else {}
+
+    tasks = []
+    windows = {}
+    for secid in secids:
+        # С resolve бумага, которой нет в справочнике ISS, не запрашивается: без режима
+        # торгов история по TQBR за всё окно дала бы пустые ответы или чужие данные
+        if resolve and secid not in infos:
+            print(f"Бумага {secid} не найдена в справочнике ISS")
+            windows[secid] = (None, None)
+            continue
+        board = infos[secid]['board'] if secid in infos else 'TQBR'
+        window = clip_to_history(infos.get(secid), start_date, end_date)
+        windows[secid] = (board, window)
+        if window is None:
+            print(f"Нет истории {secid} за период {start_date}–{end_date}")
+            continue
+        a, b = window
+        gaps = cache.missing_ranges(secid, a, b, board=board) if use_cache else [(a, b)]
+        for gap_start, gap_end in gaps:
+            tasks.extend((secid, board, c, d) for c, d in iter_chunks(gap_start, gap_end))
+
+    raw = {secid: [] for secid in secids}
+    failed = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(task, pool.submit(fetch_history_window, task[0], task[2], task[3], board=task[1]))
+                   for task in tasks]
+        for (secid, board, a, b), future in futures:
+            try:
+                dates, closes, complete = future.result()
+            except Exception as e:
+                print(f"Ошибка при запросе данных {secid} ({a}–{b}): {e}")
+                failed.add(secid)
+                continue
+            if use_cache:
+                cache.store(secid, close_rows(dates, closes), a, b, board=board, cover=complete)
+            else:
+                raw[secid].append((dates, closes))
+
+    frames = []
+    for secid in secids:
+        board, window = windows[secid]
+        # Ряд с пропущенным куском после ffill выглядел бы целым, поэтому тикер отбрасывается
+        if window is None or secid in failed:
+            df = arrays_to_frame([])
+        elif use_cache:
+            df = cache.load(secid, *window, board=board)
+        else:
+            df = arrays_to_frame(raw[secid])
+        frames.append(prepare_price_df(secid, df))
+    return frames
+
+@instrumentation.timed('loaders.get_moex_data_and_prepare')
+def get_moex_data_and_prepare(secid, start_date, end_date, use_cache=True):
+    if use_cache:
+        cache = get_price_cache()
+        start_date, end_date = normalize_dates(start_date, end_date)
+        try:
+            update_price_cache(secid, start_date, end_date, cache=cache)
+        except Exception as e:
+            print(f"Ошибка при запросе данных {secid}: {e}")
+            # Как и без кэша, берём только непрерывное начало окна, без склейки через пропуск
+            covered_till = cache.covered_until(secid, start_date)
+            end_date = min(end_date, covered_till) if covered_till else None
+        df = cache.load(secid, start_date, end_date) if end_date else arrays_to_frame([])
+    else:
+        start_date, end_date = normalize_dates(start_date, end_date)
+        chunks = []
+        for current_start_date, current_end_date in iter_chunks(start_date, end_date):
+            try:
+                chunks.append(fetch_history_arrays(secid, current_start_date, current_end_date))
+            except Exception as e:
+                print(f"Ошибка при запросе данных {secid}: {e}")
+                break
+        df = arrays_to_frame(chunks)
+
+    return prepare_price_df(secid, df)
+
+# Приводит сырые строки истории к ценам закрытия и дневным доходностям
+def prepare_price_df(secid, df):
+    if df.empty:
         print(f"Нет данных для {secid}")
         return pd.DataFrame()
 
-    df = pd.DataFrame(data)
-
     if 'TRADEDATE' not in df.columns or 'CLOSE' not in df.columns:
         print(f"Отсутствуют обязательные поля в данных {secid}: {df.columns.tolist()}")
         return pd.DataFrame()
 
     df['TRADEDATE'] = pd.to_datetime(df['TRADEDATE'])
     df.set_index('TRADEDATE', inplace=True)
-    df = df[['CLOSE']].asfreq("B").fillna(method='ffill')
+    df = df[['CLOSE']].asfreq("B").ffill()
     df.columns = [f'{secid}_Stock_Price']
     df[f'{secid}_Daily_Return'] = df[f'{secid}_Stock_Price'].pct_change()
     df.dropna(inplace=True)
 
+    instrumentation.record_frame(f'loaders.prices.{secid}', df)
     return df
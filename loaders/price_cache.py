@@ -0,0 +1,213 @@
+import datetime as dt
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from profiling import instrumentation
+
+# Путь к файлу кэша можно переопределить через переменную окружения
+DEFAULT_CACHE_PATH = os.environ.get(
+    "MOEX_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "portfolio_app", "moex_prices.sqlite")
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    engine TEXT NOT NULL,
+    market TEXT NOT NULL,
+    board TEXT NOT NULL,
+    secid TEXT NOT NULL,
+    tradedate TEXT NOT NULL,
+    close REAL,
+    PRIMARY KEY (engine, market, board, secid, tradedate)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    engine TEXT NOT NULL,
+    market TEXT NOT NULL,
+    board TEXT NOT NULL,
+    secid TEXT NOT NULL,
+    date_from TEXT NOT NULL,
+    date_till TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_key ON coverage (engine, market, board, secid);
+"""
+
+
+def _to_date(value):
+    if isinstance(value, dt.datetime):
+        return value.date()
+    if isinstance(value, dt.date):
+        return value
+    return dt.datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+# Объединение пересекающихся и соседних интервалов дат
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + dt.timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+# Локальное хранилище дневных котировок ISS.
+# Закрытые торговые дни прошлого считаются неизменяемыми: покрытый диапазон
+# дат запоминается и больше не запрашивается. Сегодняшний день в покрытие
+# не попадает и всегда загружается заново.
+class PriceCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def covered_ranges(self, secid, engine='stock', market='shares', board='TQBR'):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT date_from, date_till FROM coverage "
+                "WHERE engine=? AND market=? AND board=? AND secid=?",
+                (engine, market, board, secid)
+            ).fetchall()
+        return merge_intervals([(_to_date(a), _to_date(b)) for a, b in rows])
+
+    # Последний день непрерывного покрытия, начинающегося не позже start_date
+    # (None, если сам start_date не покрыт)
+    def covered_until(self, secid, start_date, engine='stock', market='shares', board='TQBR'):
+        start_date = _to_date(start_date)
+        for date_from, date_till in self.covered_ranges(secid, engine, market, board):
+            if date_from <= start_date <= date_till:
+                return date_till
+        return None
+
+    # Диапазоны [from, till] внутри запрошенного окна, которых нет в кэше
+    def missing_ranges(self, secid, start_date, end_date, engine='stock', market='shares', board='TQBR'):
+        start_date, end_date = _to_date(start_date), _to_date(end_date)
+        missing = []
+        cursor = start_date
+        for a, b in self.covered_ranges(secid, engine, market, board):
+            if b < cursor:
+                continue
+            if a > end_date:
+                break
+            if a > cursor:
+                missing.append((cursor, min(a - dt.timedelta(days=1), end_date)))
+            cursor = b + dt.timedelta(days=1)
+            if cursor > end_date:
+                break
+        if cursor <= end_date:
+            missing.append((cursor, end_date))
+
+        with self._lock:
+            if missing:
+                self._misses += 1
+            else:
+                self._hits += 1
+        instrumentation.record_cache('price_cache', not missing)
+        return missing
+
+    # Сохраняет строки (TRADEDATE, CLOSE) и отмечает диапазон как загруженный;
+    # cover=False — только строки (ответ неполный, диапазон будет запрошен снова)
+    def store(self, secid, rows, date_from, date_till, engine='stock', market='shares', board='TQBR',
+              cover=True):
+        date_from, date_till = _to_date(date_from), _to_date(date_till)
+        records = [
+            (engine, market, board, secid, str(tradedate)[:10], close)
+            for tradedate, close in rows
+        ]
+        # Текущий день ещё торгуется — в покрытие не включаем
+        last_closed = min(date_till, dt.date.today() - dt.timedelta(days=1))
+
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?)", records
+            )
+            if cover and date_from <= last_closed:
+                key = (engine, market, board, secid)
+                existing = conn.execute(
+                    "SELECT date_from, date_till FROM coverage "
+                    "WHERE engine=? AND market=? AND board=? AND secid=?", key
+                ).fetchall()
+                intervals = [(_to_date(a), _to_date(b)) for a, b in existing]
+                intervals.append((date_from, last_closed))
+                conn.execute(
+                    "DELETE FROM coverage WHERE engine=? AND market=? AND board=? AND secid=?", key
+                )
+                conn.executemany(
+                    "INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?)",
+                    [key + (a.isoformat(), b.isoformat()) for a, b in merge_intervals(intervals)]
+                )
+
+    def load(self, secid, start_date, end_date, engine='stock', market='shares', board='TQBR'):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT tradedate, close FROM history "
+                "WHERE engine=? AND market=? AND board=? AND secid=? "
+                "AND tradedate BETWEEN ? AND ? ORDER BY tradedate",
+                (engine, market, board, secid,
+                 _to_date(start_date).isoformat(), _to_date(end_date).isoformat())
+            ).fetchall()
+        return pd.DataFrame(rows, columns=['TRADEDATE', 'CLOSE'])
+
+    # Удаляет данные из кэша; без аргументов очищает его полностью
+    def invalidate(self, secid=None, engine=None, market=None, board=None):
+        conditions, params = [], []
+        for column, value in (('secid', secid), ('engine', engine), ('market', market), ('board', board)):
+            if value is not None:
+                conditions.append(f"{column}=?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._lock, self._connect() as conn:
+            removed = conn.execute(f"DELETE FROM history{where}", params).rowcount
+            conn.execute(f"DELETE FROM coverage{where}", params)
+        return removed
+
+    def stats(self):
+        with self._connect() as conn:
+            n_rows = conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+            n_securities = conn.execute(
+                "SELECT COUNT(*) FROM (SELECT DISTINCT engine, market, board, secid FROM history)"
+            ).fetchone()[0]
+            n_ranges = conn.execute("SELECT COUNT(*) FROM coverage").fetchone()[0]
+
+        return {
+            'path': self.path,
+            'rows': n_rows,
+            'securities': n_securities,
+            'covered_ranges': n_ranges,
+            'size_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'hits': self._hits,
+            'misses': self._misses,
+        }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+# Общий экземпляр кэша для процесса (создаётся при первом обращении)
+def get_price_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = PriceCache()
+    return _default_cache
+
+
+def cache_stats():
+    return get_price_cache().stats()
+
+
+def invalidate_cache(secid=None, engine=None, market=None, board=None):
+    return get_price_cache().invalidate(secid, engine, market, board)
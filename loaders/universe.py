@@ -0,0 +1,327 @@
+import datetime as dt
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from loaders.iss_client import ISS_URL, iss_get_json
+from loaders.price_cache import DEFAULT_CACHE_PATH
+from profiling import instrumentation
+
+# Время жизни кэша списка бумаг и сведений о режимах торгов (с)
+UNIVERSE_TTL = float(os.environ.get("MOEX_UNIVERSE_TTL", str(24 * 60 * 60)))
+
+# Пауза перед повторным обращением к ISS после неудачного запроса списка или режимов (с)
+RETRY_AFTER = 300
+
+# Размер страницы /iss/securities.json (максимум ISS — 100)
+PAGE_SIZE = 100
+
+# Список на случай, если ISS недоступен и локального кэша ещё нет
+FALLBACK_TICKERS = [
+    'SBER', 'GAZP', 'LKOH', 'TATN', 'ROSN', 'VTBR', 'NVTK', 'GMKN', 'CHMF', 'NLMK',
+    'PLZL', 'PHOR', 'MGNT', 'MTSS', 'MOEX', 'HYDR', 'IRAO', 'AFLT', 'ALRS', 'YDEX',
+]
+
+SECURITY_COLUMNS = ('secid', 'shortname', 'name', 'isin', 'type', 'group', 'primary_boardid', 'is_traded')
+BOARD_COLUMNS = ('secid', 'boardid', 'engine', 'market', 'is_primary', 'is_traded', 'history_from', 'history_till')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS universe (
+    engine TEXT NOT NULL,
+    market TEXT NOT NULL,
+    secid TEXT NOT NULL,
+    shortname TEXT,
+    name TEXT,
+    isin TEXT,
+    type TEXT,
+    sec_group TEXT,
+    primary_board TEXT,
+    is_traded INTEGER,
+    PRIMARY KEY (engine, market, secid)
+);
+CREATE TABLE IF NOT EXISTS security_boards (
+    engine TEXT NOT NULL,
+    market TEXT NOT NULL,
+    secid TEXT NOT NULL,
+    board TEXT NOT NULL,
+    is_primary INTEGER,
+    is_traded INTEGER,
+    history_from TEXT,
+    history_till TEXT,
+    PRIMARY KEY (engine, market, secid, board)
+);
+CREATE TABLE IF NOT EXISTS universe_updated (
+    kind TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    market TEXT NOT NULL,
+    key TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (kind, engine, market, key)
+);
+"""
+
+# Копии в памяти процесса: (engine, market) → (время загрузки, DataFrame)
+_universes = {}
+_infos = {}
+_failed = {}
+_lock = threading.Lock()
+_db_path = DEFAULT_CACHE_PATH
+_db_ready = False
+
+
+def _connect():
+    global _db_ready
+    if not _db_ready:
+        os.makedirs(os.path.dirname(os.path.abspath(_db_path)), exist_ok=True)
+    conn = sqlite3.connect(_db_path, timeout=30)
+    if not _db_ready:
+        conn.executescript(_SCHEMA)
+        _db_ready = True
+    return conn
+
+
+def _updated(conn, kind, engine, market, key=''):
+    row = conn.execute(
+        "SELECT updated FROM universe_updated WHERE kind=? AND engine=? AND market=? AND key=?",
+        (kind, engine, market, key)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _mark_updated(conn, kind, engine, market, key=''):
+    conn.execute("INSERT OR REPLACE INTO universe_updated VALUES (?, ?, ?, ?, ?)",
+                 (kind, engine, market, key, time.time()))
+
+
+def _block_rows(j, block):
+    data = j.get(block) or {}
+    columns = [c.lower() for c in data.get('columns', [])]
+    return [dict(zip(columns, row)) for row in data.get('data', [])]
+
+
+def _to_date(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, dt.date):
+        return value
+    return dt.datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+# Полный список бумаг рынка из /iss/securities.json, постранично по PAGE_SIZE строк
+def fetch_securities(engine='stock', market='shares', is_trading=True):
+    url = f"{ISS_URL}/securities.json"
+    params = {
+        'engine': engine, 'market': market, 'iss.meta': 'off', 'iss.only': 'securities',
+        'securities.columns': ','.join(SECURITY_COLUMNS), 'limit': PAGE_SIZE,
+    }
+    if is_trading:
+        params['is_trading'] = 1
+
+    rows = []
+    start = 0
+    while True:
+        page = _block_rows(iss_get_json(url, params={**params, 'start': start}), 'securities')
+        rows.extend(page)
+        start += len(page)
+        if len(page) < PAGE_SIZE:
+            break
+
+    print(f"Загружен список бумаг {engine}/{market}: {len(rows)}")
+    df = pd.DataFrame(rows, columns=list(SECURITY_COLUMNS))
+    return df.drop_duplicates('secid').sort_values('secid').reset_index(drop=True)
+
+
+def _load_universe(conn, engine, market):
+    return pd.read_sql_query(
+        "SELECT secid, shortname, name, isin, type, sec_group AS 'group', primary_board AS primary_boardid, "
+        "is_traded FROM universe WHERE engine=? AND market=? ORDER BY secid",
+        conn, params=(engine, market)
+    )
+
+
+def _store_universe(conn, engine, market, df):
+    conn.execute("DELETE FROM universe WHERE engine=? AND market=?", (engine, market))
+    conn.executemany(
+        "INSERT OR REPLACE INTO universe VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(engine, market, *row) for row in df[list(SECURITY_COLUMNS)].itertuples(index=False, name=None)]
+    )
+    _mark_updated(conn, 'universe', engine, market)
+
+
+# Список торгуемых бумаг рынка (secid, shortname, name, isin, type, group, primary_boardid, is_traded).
+# Берётся из памяти или SQLite-кэша, если он моложе max_age секунд, иначе загружается из ISS.
+# При ошибке сети используется устаревший кэш, если он есть.
+def get_universe(engine='stock', market='shares', max_age=UNIVERSE_TTL, refresh=False):
+    key = (engine, market)
+    with _lock:
+        cached = _universes.get(key)
+    if cached and not refresh and time.time() - cached[0] < max_age:
+        instrumentation.record_cache('universe', True)
+        return cached[1]
+
+    with _connect() as conn:
+        updated = _updated(conn, 'universe', engine, market)
+        stored = _load_universe(conn, engine, market) if updated else None
+
+    if stored is not None and not refresh and time.time() - updated < max_age:
+        instrumentation.record_cache('universe', True)
+        universe, loaded_at = stored, updated
+    else:
+        instrumentation.record_cache('universe', False)
+        try:
+            universe = fetch_securities(engine, market)
+        except Exception as e:
+            if stored is None or stored.empty:
+                raise
+            print(f"Не удалось обновить список бумаг, используется кэш: {e}")
+            universe, loaded_at = stored, updated
+        else:
+            loaded_at = time.time()
+            with _connect() as conn:
+                _store_universe(conn, engine, market, universe)
+
+    with _lock:
+        _universes[key] = (loaded_at, universe)
+    return universe
+
+
+# Тикеры для выбора в интерфейсе; без ISS и кэша — FALLBACK_TICKERS
+def get_ticker_options(engine='stock', market='shares'):
+    key = ('universe', engine, market)
+    if time.time() - _failed.get(key, 0) < RETRY_AFTER:
+        return FALLBACK_TICKERS, {}
+    try:
+        universe = get_universe(engine, market)
+    except Exception as e:
+        print(f"Список бумаг недоступен: {e}")
+        _failed[key] = time.time()
+        return FALLBACK_TICKERS, {}
+    names = dict(zip(universe['secid'], universe['shortname'].fillna('')))
+    return universe['secid'].tolist(), names
+
+
+# Режимы торгов бумаги с диапазонами истории из /iss/securities/{secid}.json (блок boards)
+def fetch_security_boards(secid):
+    url = f"{ISS_URL}/securities/{secid}.json"
+    params = {'iss.meta': 'off', 'iss.only': 'boards', 'boards.columns': ','.join(BOARD_COLUMNS)}
+    return _block_rows(iss_get_json(url, params=params), 'boards')
+
+
+# Основной режим бумаги на рынке и доступный диапазон истории:
+# режим с is_primary=1, иначе режим с самой поздней датой истории
+def _primary_board(boards, engine, market):
+    candidates = [b for b in boards if b.get('engine') == engine and b.get('market') == market]
+    if not candidates:
+        return None
+    primary = [b for b in candidates if b.get('is_primary') == 1]
+    board = primary[0] if primary else max(candidates, key=lambda b: str(b.get('history_till') or ''))
+    return {
+        'secid': board['secid'],
+        'board': board['boardid'],
+        'is_traded': board.get('is_traded') == 1,
+        'history_from': _to_date(board.get('history_from')),
+        'history_till': _to_date(board.get('history_till')),
+    }
+
+
+def _load_info(conn, secid, engine, market):
+    rows = conn.execute(
+        "SELECT secid, board, is_primary, is_traded, history_from, history_till FROM security_boards "
+        "WHERE engine=? AND market=? AND secid=?", (engine, market, secid)
+    ).fetchall()
+    boards = [
+        {'secid': s, 'boardid': b, 'engine': engine, 'market': market, 'is_primary': p, 'is_traded': t,
+         'history_from': f, 'history_till': u}
+        for s, b, p, t, f, u in rows
+    ]
+    return _primary_board(boards, engine, market)
+
+
+def _store_boards(conn, secid, engine, market, boards):
+    conn.execute("DELETE FROM security_boards WHERE engine=? AND market=? AND secid=?", (engine, market, secid))
+    conn.executemany(
+        "INSERT OR REPLACE INTO security_boards VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(engine, market, secid, b['boardid'], b.get('is_primary'), b.get('is_traded'),
+          b.get('history_from'), b.get('history_till'))
+         for b in boards if b.get('engine') == engine and b.get('market') == market]
+    )
+    _mark_updated(conn, 'boards', engine, market, secid)
+
+
+# Сведения о бумаге: {'secid', 'board', 'is_traded', 'history_from', 'history_till'} или None,
+# если бумага не торгуется на рынке. Кэшируется в памяти и SQLite на max_age секунд.
+def get_security_info(secid, engine='stock', market='shares', max_age=UNIVERSE_TTL):
+    key = (engine, market, secid)
+    with _lock:
+        cached = _infos.get(key)
+    if cached and time.time() - cached[0] < max_age:
+        instrumentation.record_cache('security_info', True)
+        return cached[1]
+
+    with _connect() as conn:
+        updated = _updated(conn, 'boards', engine, market, secid)
+        fresh = updated is not None and time.time() - updated < max_age
+        info = _load_info(conn, secid, engine, market) if fresh else None
+
+    instrumentation.record_cache('security_info', fresh)
+    if not fresh:
+        boards = fetch_security_boards(secid)
+        info = _primary_board(boards, engine, market)
+        updated = time.time()
+        with _connect() as conn:
+            _store_boards(conn, secid, engine, market, boards)
+
+    with _lock:
+        _infos[key] = (updated, info)
+    return info
+
+
+# Сведения сразу по нескольким бумагам (недостающие в кэше запрашиваются параллельно).
+# Бумаги, по которым запрос не удался, в результат не попадают и RETRY_AFTER секунд
+# не запрашиваются повторно.
+def get_securities_info(secids, engine='stock', market='shares', max_workers=8):
+    def load(secid):
+        key = ('boards', engine, market, secid)
+        if time.time() - _failed.get(key, 0) < RETRY_AFTER:
+            return None
+        try:
+            return get_security_info(secid, engine, market)
+        except Exception as e:
+            print(f"Не удалось получить режимы торгов {secid}: {e}")
+            _failed[key] = time.time()
+            return None
+
+    secids = list(secids)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        infos = list(pool.map(load, secids))
+    return {secid: info for secid, info in zip(secids, infos) if info is not None}
+
+
+# Пересечение окна [start, end] с доступной историей бумаги; None — данных за окно нет.
+# Конец окна обрезается только для режимов, где торги прекращены: у торгуемых бумаг
+# history_till из кэша отстаёт до UNIVERSE_TTL, и последние дни (включая сегодня) терялись бы.
+def clip_to_history(info, start_date, end_date):
+    if info is None:
+        return start_date, end_date
+    start = max(start_date, info['history_from']) if info['history_from'] else start_date
+    end = end_date
+    if info['history_till'] and not info.get('is_traded'):
+        end = min(end_date, info['history_till'])
+    if start > end:
+        return None
+    return start, end
+
+
+def clear_universe_cache():
+    with _lock:
+        _universes.clear()
+        _infos.clear()
+        _failed.clear()
+    with _connect() as conn:
+        conn.execute("DELETE FROM universe")
+        conn.execute("DELETE FROM security_boards")
+        conn.execute("DELETE FROM universe_updated")
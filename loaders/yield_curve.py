@@ -0,0 +1,239 @@
+import datetime as dt
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from loaders.iss_client import ISS_URL, iss_get_json
+from loaders.price_cache import DEFAULT_CACHE_PATH
+from profiling import instrumentation
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS zcyc_dates (
+    engine TEXT NOT NULL,
+    date TEXT NOT NULL,
+    PRIMARY KEY (engine, date)
+);
+CREATE TABLE IF NOT EXISTS zcyc (
+    engine TEXT NOT NULL,
+    date TEXT NOT NULL,
+    period REAL NOT NULL,
+    value REAL,
+    PRIMARY KEY (engine, date, period)
+);
+CREATE TABLE IF NOT EXISTS zcyc_fallback (
+    engine TEXT NOT NULL,
+    date TEXT NOT NULL,
+    resolved TEXT NOT NULL,
+    PRIMARY KEY (engine, date)
+);
+"""
+
+# На сколько дней назад искать кривую, если на дату она пустая (выходные, праздники)
+FALLBACK_DAYS = 7
+
+# Сколько секунд кривая текущего дня живёт в памяти (в течение дня ISS её обновляет)
+TODAY_TTL = float(os.environ.get("MOEX_ZCYC_TODAY_TTL", str(15 * 60)))
+
+# Кривые в памяти процесса: (engine, дата) → (Series доходностей по срокам (в годах),
+# момент устаревания или None для прошлых дат)
+_curves = {}
+_lock = threading.Lock()
+_db_path = DEFAULT_CACHE_PATH
+_db_ready = False
+
+
+def _to_date(value):
+    if isinstance(value, (dt.datetime, pd.Timestamp)):
+        return value.date()
+    if isinstance(value, dt.date):
+        return value
+    return dt.datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def _connect():
+    global _db_ready
+    if not _db_ready:
+        os.makedirs(os.path.dirname(os.path.abspath(_db_path)), exist_ok=True)
+    conn = sqlite3.connect(_db_path, timeout=30)
+    if not _db_ready:
+        conn.executescript(_SCHEMA)
+        _db_ready = True
+    return conn
+
+
+def _load_stored(engine, date):
+    with _connect() as conn:
+        known = conn.execute(
+            "SELECT 1 FROM zcyc_dates WHERE engine=? AND date=?", (engine, date.isoformat())
+        ).fetchone()
+        if not known:
+            return None
+        rows = conn.execute(
+            "SELECT period, value FROM zcyc WHERE engine=? AND date=? ORDER BY period",
+            (engine, date.isoformat())
+        ).fetchall()
+    # Пустые кривые, сохранённые раньше, не считаются загруженными
+    if not rows:
+        return None
+    return _make_curve([p for p, _ in rows], [v for _, v in rows])
+
+
+def _store(engine, date, curve):
+    with _connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO zcyc_dates VALUES (?, ?)", (engine, date.isoformat()))
+        conn.executemany(
+            "INSERT OR REPLACE INTO zcyc VALUES (?, ?, ?, ?)",
+            [(engine, date.isoformat(), float(p), float(v)) for p, v in curve.items()]
+        )
+
+
+# Дата, на которую ранее была найдена кривая вместо пустой date (None, если не запоминалась)
+def _load_fallback(engine, date):
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT resolved FROM zcyc_fallback WHERE engine=? AND date=?", (engine, date.isoformat())
+        ).fetchone()
+    return _to_date(row[0]) if row else None
+
+
+def _store_fallback(engine, date, resolved):
+    with _connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO zcyc_fallback VALUES (?, ?, ?)",
+                     (engine, date.isoformat(), resolved.isoformat()))
+
+
+def _remember(key, curve):
+    expires = time.time() + TODAY_TTL if key[1] >= dt.date.today() else None
+    with _lock:
+        _curves[key] = (curve, expires)
+
+
+def _recall(key):
+    with _lock:
+        entry = _curves.get(key)
+        if entry is None:
+            return None
+        curve, expires = entry
+        if expires is not None and time.time() >= expires:
+            del _curves[key]
+            return None
+        return curve
+
+
+# values — доходности в долях (ISS отдаёт проценты)
+def _make_curve(periods, values):
+    curve = pd.Series(np.asarray(values, dtype=float), index=np.asarray(periods, dtype=float), name='yield')
+    curve.index.name = 'period'
+    return curve.sort_index()
+
+
+def get_rf_moex(date, engine='stock'):
+    url = f"{ISS_URL}/engines/{engine}/zcyc.json"
+    return iss_get_json(url, params={'date': str(date), 'iss.meta': 'off', 'iss.only': 'yearyields'},
+                        encoding='utf-8-sig')
+
+
+# Загружает кривую бескупонной доходности ОФЗ (блок yearyields) на дату;
+# сроки без значения (null) пропускаются
+def fetch_yield_curve(date, engine='stock'):
+    block = get_rf_moex(date, engine).get('yearyields', {})
+    columns = block.get('columns', [])
+    data = block.get('data', [])
+    if not data or 'period' not in columns or 'value' not in columns:
+        return _make_curve([], [])
+
+    i_period, i_value = columns.index('period'), columns.index('value')
+    rows = [r for r in data if r[i_period] is not None and r[i_value] is not None]
+    return _make_curve([r[i_period] for r in rows], [r[i_value] / 100 for r in rows])
+
+
+def _curve_on(date, engine):
+    key = (engine, date)
+    curve = _recall(key)
+    if curve is not None:
+        instrumentation.record_cache('yield_curve', True)
+        return curve
+
+    curve = _load_stored(engine, date)
+    instrumentation.record_cache('yield_curve', curve is not None)
+    if curve is None:
+        curve = fetch_yield_curve(date, engine)
+        # Пустая кривая (выходной, праздник или сбой ISS) не сохраняется — дата будет запрошена снова
+        if curve.empty:
+            return curve
+        if date < dt.date.today():
+            _store(engine, date, curve)
+
+    _remember(key, curve)
+    return curve
+
+
+# Кривая доходности на дату (доли, годовые). Кривые прошлых дат хранятся в памяти
+# и в SQLite-кэше и повторно из сети не запрашиваются; текущий день — в памяти
+# не дольше TODAY_TTL секунд.
+# Если на дату кривой нет, берётся ближайшая более ранняя не пустая кривая
+# (не дальше fallback_days дней); для прошлых дат она запоминается в памяти под исходной датой,
+# а для дат старше FALLBACK_DAYS дней найденная дата сохраняется и в SQLite, чтобы
+# выходные и праздники не запрашивались заново после перезапуска.
+def get_yield_curve(date, engine='stock', fallback_days=FALLBACK_DAYS):
+    date = _to_date(date)
+    settled = date < dt.date.today() - dt.timedelta(days=FALLBACK_DAYS)
+    resolved = _load_fallback(engine, date) if settled and _recall((engine, date)) is None else None
+    if resolved is not None and (date - resolved).days <= fallback_days:
+        curve = _curve_on(resolved, engine)
+        if not curve.empty:
+            _remember((engine, date), curve)
+            return curve
+
+    curve = _curve_on(date, engine)
+    for days in range(1, fallback_days + 1):
+        if not curve.empty:
+            break
+        resolved = date - dt.timedelta(days=days)
+        curve = _curve_on(resolved, engine)
+        if not curve.empty and date < dt.date.today():
+            _remember((engine, date), curve)
+            if settled:
+                _store_fallback(engine, date, resolved)
+    return curve
+
+
+# Кривые на набор дат; недостающие в кэше даты загружаются параллельно
+def get_yield_curves(dates, engine='stock', max_workers=8):
+    dates = sorted({_to_date(d) for d in dates})
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        curves = list(pool.map(lambda d: get_yield_curve(d, engine), dates))
+    return dict(zip(dates, curves))
+
+
+# Доходность для произвольного срока (в годах) линейной интерполяцией по кривой
+def interpolate_yield(curve, tenor):
+    if curve.empty:
+        return None
+    return float(np.interp(tenor, curve.index.to_numpy(), curve.to_numpy()))
+
+
+# Дневной ряд безрисковой ставки (годовой, в долях) для индекса портфеля.
+# Кривые берутся на даты сетки freq (по умолчанию — пятницы) и протягиваются вперёд,
+# чтобы длинная история не требовала отдельного запроса на каждый день.
+def risk_free_series(index, tenor=1, freq='W-FRI', engine='stock', max_workers=8):
+    index = pd.DatetimeIndex(index)
+    if index.empty:
+        return pd.Series(dtype=float, index=index)
+
+    grid = pd.date_range(index[0], index[-1], freq=freq).union(index[[0, -1]])
+    curves = get_yield_curves(grid, engine, max_workers)
+    rates = pd.Series(
+        [interpolate_yield(curves[d.date()], tenor) for d in grid], index=grid, dtype=float
+    )
+    return rates.reindex(grid.union(index)).ffill().bfill().reindex(index)
+
+
+def clear_yield_cache():
+    with _lock:
+        _curves.clear()
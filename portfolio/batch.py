@@ -0,0 +1,248 @@
+# Пакетный анализ портфелей без интерфейса.
+#
+# Запуск: python -m portfolio.batch portfolios.json --output reports/
+#
+# Файл портфелей — JSON-список объектов {"name", "tickers", "weights", "start", "end"}
+# или CSV с колонками name, ticker, weight, start, end (одна строка на актив).
+# С флагом --profile в каталог результатов пишутся profile.json и profile.prom.
+import argparse
+import datetime as dt
+import importlib.util
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from loaders.moex_loader import fetch_many
+from loaders.risk_free_rate import get_risk_free_rate
+from portfolio.constructor import build_panel
+from portfolio.covariance import estimate_covariance
+from portfolio.optimizer import optimize_portfolio_weights
+from portfolio.risk_return import calc_portfolio_metrics
+from portfolio.var_analysis import perform_var_analysis
+from profiling import instrumentation
+
+
+def _to_date(value):
+    if isinstance(value, dt.date):
+        return value
+    return dt.datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+# Читает описание портфелей из JSON или CSV
+def read_portfolios(path):
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            specs = json.load(f)
+    else:
+        table = pd.read_csv(path)
+        specs = []
+        for name, rows in table.groupby('name', sort=False):
+            specs.append({
+                'name': name,
+                'tickers': rows['ticker'].tolist(),
+                'weights': rows['weight'].astype(float).tolist(),
+                'start': rows['start'].iloc[0],
+                'end': rows['end'].iloc[0],
+            })
+
+    for spec in specs:
+        spec['start'], spec['end'] = _to_date(spec['start']), _to_date(spec['end'])
+        if len(spec['tickers']) != len(spec['weights']):
+            raise ValueError(f"Количество тикеров и весов не совпадает в портфеле {spec['name']}")
+    return specs
+
+
+# Секундомер этапов: накапливает время по имени этапа
+# (при включённом профилировании этап также попадает в общую статистику как batch.<имя>)
+class StageTimer:
+    def __init__(self):
+        self.timings = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            with instrumentation.stage(f"batch.{name}"):
+                yield
+        finally:
+            self.timings[name] += time.perf_counter() - started
+
+
+# Анализ одного портфеля (выполняется в рабочем процессе)
+def analyse_portfolio(spec, frames, risk_free_rate, target_volatility=0.20, ma_window=50):
+    timer = StageTimer()
+    row = {'name': spec['name'], 'start': spec['start'], 'end': spec['end'], 'risk_free_rate': risk_free_rate}
+    weights_rows = []
+
+    try:
+        tickers = spec['tickers']
+        weights = np.asarray(spec['weights'], dtype=float)
+        start, end = pd.Timestamp(spec['start']), pd.Timestamp(spec['end'])
+
+        with timer.stage('build_portfolio'):
+            panel = build_panel([frames[t].loc[start:end] for t in tickers], tickers)
+            port_df = panel.to_frame(weights)
+
+        with timer.stage('metrics'):
+            metrics = calc_portfolio_metrics(port_df, risk_free_rate)
+            metrics['cumulative_return'] = (1 + port_df['Portfolio_Return']).prod() - 1
+            row.update(metrics)
+
+        with timer.stage('var'):
+            _, var_results, _ = perform_var_analysis(port_df, ma_window=ma_window)
+            row.update(var_results)
+
+        with timer.stage('optimize'):
+            mean_returns = port_df[panel.return_cols].mean().to_numpy()
+            cov_estimate = estimate_covariance(port_df, tickers)
+            try:
+                opt_weights, max_return = optimize_portfolio_weights(
+                    mean_returns, cov_estimate, target_volatility=target_volatility, init_guess=weights
+                )
+                row['opt_expected_return'] = max_return
+                row['opt_volatility'] = float(cov_estimate.volatility(opt_weights))
+            except ValueError as e:
+                opt_weights = np.full(len(tickers), np.nan)
+                row['opt_error'] = str(e)
+
+        weights_rows = [
+            {'name': spec['name'], 'ticker': t, 'weight': w, 'opt_weight': ow}
+            for t, w, ow in zip(tickers, weights, opt_weights)
+        ]
+    except (KeyError, ValueError) as e:
+        row['error'] = str(e)
+
+    return row, weights_rows, dict(timer.timings)
+
+
+# Анализ в рабочем процессе: статистика профилирования собирается заново для каждой
+# задачи и возвращается вместе с результатом для объединения в родительском процессе
+def _analyse_in_worker(*task):
+    instrumentation.reset()
+    output = analyse_portfolio(*task)
+    return output, instrumentation.snapshot()
+
+
+# Parquet пишется через pyarrow или fastparquet (pandas выбирает доступный)
+def parquet_available():
+    return any(importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet'))
+
+
+def _write_table(df, path_base, fmt):
+    if fmt == 'parquet':
+        path = f"{path_base}.parquet"
+        df.to_parquet(path, index=False)
+    else:
+        path = f"{path_base}.csv"
+        df.to_csv(path, index=False)
+    return path
+
+
+# Безрисковая ставка на дату; если кривую получить не удалось — 0 с предупреждением,
+# чтобы сбой ISS не останавливал весь пакетный прогон
+def _risk_free_rate(date):
+    try:
+        return get_risk_free_rate(date.strftime("%Y-%m-%d")) or 0.0
+    except Exception as e:
+        print(f"Не удалось получить безрисковую ставку на {date:%Y-%m-%d}, используется 0: {e}")
+        return 0.0
+
+
+# Полный пакетный прогон: одна загрузка объединения тикеров, параллельный анализ,
+# запись сводки, весов и времени этапов
+def run_batch(specs, output_dir='.', fmt='csv', n_workers=None, target_volatility=0.20, ma_window=50):
+    timer = StageTimer()
+
+    with timer.stage('fetch'):
+        tickers = sorted({t for spec in specs for t in spec['tickers']})
+        start = min(spec['start'] for spec in specs)
+        end = max(spec['end'] for spec in specs)
+        frames = {t: df for t, df in zip(tickers, fetch_many(tickers, start, end, resolve=True)) if not df.empty}
+
+    with timer.stage('risk_free_rate'):
+        rates = {d: _risk_free_rate(d) for d in {s['start'] for s in specs}}
+
+    with timer.stage('analysis'):
+        tasks = []
+        for spec in specs:
+            missing = [t for t in spec['tickers'] if t not in frames]
+            if missing:
+                print(f"Нет данных для {missing} в портфеле {spec['name']}")
+            needed = {t: frames[t] for t in spec['tickers'] if t in frames}
+            tasks.append((spec, needed, rates[spec['start']], target_volatility, ma_window))
+
+        if n_workers == 1 or len(tasks) <= 1:
+            outputs = [analyse_portfolio(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=instrumentation.enable,
+                                     initargs=(instrumentation.is_enabled(),)) as pool:
+                outputs = []
+                for output, profile in pool.map(_analyse_in_worker, *zip(*tasks)):
+                    outputs.append(output)
+                    instrumentation.merge(profile)
+
+    with timer.stage('write'):
+        os.makedirs(output_dir, exist_ok=True)
+        summary = pd.DataFrame([row for row, _, _ in outputs])
+        weights = pd.DataFrame([w for _, rows, _ in outputs for w in rows])
+        paths = [
+            _write_table(summary, os.path.join(output_dir, 'summary'), fmt),
+            _write_table(weights, os.path.join(output_dir, 'weights'), fmt),
+        ]
+
+    # Время этапов: загрузка и запись — по прогону, этапы анализа — сумма по портфелям
+    stage_timings = dict(timer.timings)
+    for _, _, timings in outputs:
+        for name, seconds in timings.items():
+            stage_timings[f"portfolio.{name}"] = stage_timings.get(f"portfolio.{name}", 0.0) + seconds
+    timings_df = pd.DataFrame(sorted(stage_timings.items()), columns=['stage', 'seconds'])
+    paths.append(_write_table(timings_df, os.path.join(output_dir, 'timings'), 'csv'))
+
+    if instrumentation.is_enabled():
+        paths.append(os.path.join(output_dir, 'profile.json'))
+        instrumentation.to_json(paths[-1])
+        paths.append(os.path.join(output_dir, 'profile.prom'))
+        instrumentation.to_prometheus(paths[-1])
+
+    return summary, weights, timings_df, paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный анализ портфелей MOEX")
+    parser.add_argument('portfolios', help="JSON или CSV с описанием портфелей")
+    parser.add_argument('--output', default='batch_output', help="каталог для результатов")
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+    parser.add_argument('--workers', type=int, default=None, help="число рабочих процессов")
+    parser.add_argument('--target-volatility', type=float, default=0.20)
+    parser.add_argument('--ma-window', type=int, default=50)
+    parser.add_argument('--profile', action='store_true',
+                        help="сохранить статистику профилирования (JSON и Prometheus)")
+    args = parser.parse_args(argv)
+
+    # Проверка до загрузки данных, чтобы не потерять результаты расчёта на записи
+    if args.format == 'parquet' and not parquet_available():
+        parser.error("для --format parquet нужен pyarrow (pip install pyarrow) или fastparquet; "
+                     "либо используйте --format csv")
+
+    if args.profile:
+        instrumentation.enable()
+
+    specs = read_portfolios(args.portfolios)
+    _, _, timings, paths = run_batch(
+        specs, args.output, args.format, args.workers, args.target_volatility, args.ma_window
+    )
+
+    print("Время этапов, с:")
+    for stage, seconds in timings.itertuples(index=False):
+        print(f"  {stage:<28} {seconds:8.3f}")
+    print("Результаты:", ", ".join(paths))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,62 @@
+import numpy as np
 import pandas as pd
 
-def build_portfolio_df(dfs, tickers, weights):
-    from functools import reduce
-    import pandas as pd
+from profiling import instrumentation
+
+# Выровненная панель цен и доходностей: матрицы (T, N) на общем индексе рабочих дней.
+# Собирается одним concat; пересчёт портфеля под новые веса — одно матричное умножение.
+class PortfolioPanel:
+    def __init__(self, dfs, tickers):
+        if len(dfs) != len(tickers):
+            raise ValueError("Количество DataFrame и тикеров не совпадает")
+
+        merged = pd.concat(dfs, axis=1, join='outer').sort_index().dropna()
+
+        # Столбцы цен и доходностей
+        self.price_cols = [f"{t}_Stock_Price" for t in tickers if f"{t}_Stock_Price" in merged.columns]
+        self.return_cols = [f"{t}_Daily_Return" for t in tickers if f"{t}_Daily_Return" in merged.columns]
 
-    if len(dfs) != len(tickers):
-        raise ValueError("Количество DataFrame и тикеров не совпадает")
+        if len(self.price_cols) != len(tickers) or len(self.return_cols) != len(tickers):
+            missing = [t for t in tickers if f"{t}_Stock_Price" not in merged.columns or f"{t}_Daily_Return" not in merged.columns]
+            raise KeyError(f"Некорректные данные для тикеров: {missing}")
 
-    merged = reduce(lambda left, right: pd.merge(left, right, left_index=True, right_index=True, how='outer'), dfs)
-    merged = merged.sort_index().dropna()
+        self.tickers = list(tickers)
+        self.frame = merged
+        self.index = merged.index
+        self.prices = merged[self.price_cols].to_numpy(dtype=float)
+        self.returns = merged[self.return_cols].to_numpy(dtype=float)
 
-    # Столбцы цен и доходностей
-    price_cols = [f"{t}_Stock_Price" for t in tickers if f"{t}_Stock_Price" in merged.columns]
-    return_cols = [f"{t}_Daily_Return" for t in tickers if f"{t}_Daily_Return" in merged.columns]
+    def _weights(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        if weights.shape[-1] != len(self.tickers):
+            raise KeyError(f"Некорректные данные для тикеров: ожидается {len(self.tickers)} весов")
+        return weights
 
-    if len(price_cols) != len(weights) or len(return_cols) != len(weights):
-        missing = [t for i, t in enumerate(tickers) if f"{t}_Stock_Price" not in merged.columns or f"{t}_Daily_Return" not in merged.columns]
-        raise KeyError(f"Некорректные данные для тикеров: {missing}")
+    # Цена и доходность портфеля (для матрицы весов (K, N) — по столбцу на портфель)
+    def portfolio_price(self, weights):
+        return self.prices @ self._weights(weights).T
 
-    merged['Portfolio_Price'] = sum(weights[i] * merged[price_cols[i]] for i in range(len(weights)))
-    merged['Portfolio_Return'] = sum(weights[i] * merged[return_cols[i]] for i in range(len(weights)))
+    def portfolio_return(self, weights):
+        return self.returns @ self._weights(weights).T
+
+    # DataFrame в формате build_portfolio_df: столбцы активов + Portfolio_Price/Portfolio_Return
+    def to_frame(self, weights):
+        df = self.frame.copy()
+        df['Portfolio_Price'] = self.portfolio_price(weights)
+        df['Portfolio_Return'] = self.portfolio_return(weights)
+        return df
+
+@instrumentation.timed('portfolio.build_panel')
+def build_panel(dfs, tickers):
+    return PortfolioPanel(dfs, tickers)
+
+# dfs — список DataFrame по тикерам или уже собранная PortfolioPanel
+def build_portfolio_df(dfs, tickers, weights):
+    if isinstance(dfs, PortfolioPanel):
+        if dfs.tickers != list(tickers):
+            raise ValueError("Панель собрана для другого набора тикеров")
+        panel = dfs
+    else:
+        panel = PortfolioPanel(dfs, tickers)
 
-    return merged
\ No newline at end of file
+    return panel.to_frame(weights)
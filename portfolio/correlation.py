@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import leaves_list, linkage
+from scipy.spatial.distance import squareform
+
+from profiling import instrumentation
+
+
+# Корреляции по парно полным наблюдениям (как DataFrame.corr) за один проход:
+# суммы по общим для пары дням считаются матричными произведениями маски и значений.
+# weights — веса наблюдений (T,), demean=False — корреляция вокруг нуля (RiskMetrics).
+def _pairwise_correlation(x, weights=None, demean=True, min_periods=2):
+    x = np.asarray(x, dtype=float)
+    mask = ~np.isnan(x)
+    if demean:
+        # Сдвиг на среднее столбца не меняет корреляцию, но уменьшает ошибки округления
+        x = x - np.where(mask, x, 0.0).sum(axis=0) / np.maximum(mask.sum(axis=0), 1)
+    x0 = np.where(mask, x, 0.0)
+    m = mask.astype(float)
+    w = np.ones(len(x)) if weights is None else np.asarray(weights, dtype=float)
+
+    xw = x0 * w[:, None]
+    counts = m.T @ m
+    n = (m * w[:, None]).T @ m
+    sum_xy = xw.T @ x0
+    sum_xx = (x0 * xw).T @ m
+    if demean:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sum_x = xw.T @ m
+            cov = sum_xy - sum_x * sum_x.T / n
+            var = sum_xx - sum_x ** 2 / n
+    else:
+        cov, var = sum_xy, sum_xx
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = cov / np.sqrt(var * var.T)
+    corr[(counts < min_periods) | ~(var > 0) | ~(var.T > 0)] = np.nan
+    np.clip(corr, -1.0, 1.0, out=corr)
+    diag = np.diag(var) > 0
+    corr[np.diag_indices_from(corr)] = np.where(diag & (np.diag(counts) >= min_periods), 1.0, np.nan)
+    return corr
+
+
+def _as_returns(returns):
+    if isinstance(returns, pd.DataFrame):
+        return returns.to_numpy(dtype=float), list(returns.columns), returns.index
+    values = np.atleast_2d(np.asarray(returns, dtype=float))
+    return values, list(range(values.shape[1])), pd.RangeIndex(len(values))
+
+
+# Матрица корреляций Пирсона по парно полным наблюдениям; совпадает с DataFrame.corr()
+@instrumentation.timed('portfolio.correlation')
+def correlation_matrix(returns, min_periods=2):
+    values, columns, _ = _as_returns(returns)
+    return pd.DataFrame(_pairwise_correlation(values, min_periods=min_periods), index=columns, columns=columns)
+
+
+# EWMA-корреляция на последнюю дату: веса (1 − λ)·λ^k, нулевое среднее (RiskMetrics);
+# без пропусков совпадает с нормированной ewma_covariance из portfolio.covariance
+def ewma_correlation(returns, lam=0.94, min_periods=2):
+    values, columns, _ = _as_returns(returns)
+    weights = (1 - lam) * lam ** np.arange(len(values) - 1, -1, -1)
+    corr = _pairwise_correlation(values, weights=weights, demean=False, min_periods=min_periods)
+    return pd.DataFrame(corr, index=columns, columns=columns)
+
+
+# Скользящие корреляции по окнам window с шагом step: массив (K, N, N) и даты концов окон.
+# Память растёт как K·N², поэтому для всего рынка нужен шаг step > 1.
+def rolling_correlation(returns, window=60, step=1, min_periods=None):
+    values, columns, index = _as_returns(returns)
+    min_periods = min_periods or window
+    ends = np.arange(window, len(values) + 1, step)
+    result = np.empty((len(ends), len(columns), len(columns)))
+    for i, end in enumerate(ends):
+        result[i] = _pairwise_correlation(values[end - window:end], min_periods=min_periods)
+    return result, index[ends - 1]
+
+
+# Порядок активов по иерархической кластеризации: расстояние sqrt((1 − ρ) / 2),
+# сильно коррелированные активы оказываются рядом на тепловой карте
+def cluster_order(corr, method='average'):
+    matrix = np.nan_to_num(np.asarray(corr, dtype=float), nan=0.0)
+    if len(matrix) < 3:
+        return np.arange(len(matrix))
+    distance = np.sqrt(np.clip((1 - matrix) / 2, 0.0, 1.0))
+    np.fill_diagonal(distance, 0.0)
+    condensed = squareform((distance + distance.T) / 2, checks=False)
+    return leaves_list(linkage(condensed, method=method))
+
+
+# Переставляет строки и столбцы матрицы корреляций в порядке кластеров
+def reorder_by_clusters(corr, method='average'):
+    order = cluster_order(corr, method)
+    return corr.iloc[order, order]
@@ -0,0 +1,128 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from profiling import instrumentation
+
+ESTIMATORS = ('sample', 'ledoit_wolf', 'ewma', 'factor')
+
+# Размер кэша оценок (ключ: тикеры, диапазон дат, оценщик и его параметры)
+CACHE_SIZE = 32
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# Нижний треугольный множитель Холецкого; для вырожденной матрицы
+# добавляется небольшая диагональ
+def cholesky_factor(cov):
+    cov = np.atleast_2d(np.asarray(cov, dtype=float))
+    jitter = 0.0
+    scale = np.mean(np.diag(cov)) or 1.0
+    for _ in range(10):
+        try:
+            return np.linalg.cholesky(cov + jitter * np.eye(len(cov)))
+        except np.linalg.LinAlgError:
+            jitter = max(jitter * 10, scale * 1e-10)
+    raise ValueError("Ковариационная матрица не является положительно определённой")
+
+
+# Ковариационная матрица вместе с разложением Холецкого (cov = chol @ chol.T).
+# Квадратичные формы считаются через chol.T @ w без повторного умножения на матрицу.
+class CovarianceEstimate:
+    def __init__(self, matrix, tickers, estimator='sample'):
+        self.matrix = np.atleast_2d(np.asarray(matrix, dtype=float))
+        self.tickers = list(tickers)
+        self.estimator = estimator
+        self.chol = cholesky_factor(self.matrix)
+
+    # w^T Σ w для вектора (N,) или матрицы весов (K, N)
+    def quad_form(self, weights):
+        projected = np.asarray(weights, dtype=float) @ self.chol
+        return np.sum(projected ** 2, axis=-1)
+
+    # Годовая волатильность портфеля по дневной ковариации
+    def volatility(self, weights, periods=252):
+        return np.sqrt(self.quad_form(weights) * periods)
+
+
+def sample_covariance(returns):
+    return np.atleast_2d(np.cov(returns, rowvar=False))
+
+
+# Ledoit-Wolf (2004): сжатие выборочной ковариации к масштабированной единичной матрице
+def ledoit_wolf_covariance(returns):
+    x = returns - returns.mean(axis=0)
+    n_obs, n_assets = x.shape
+    sample = x.T @ x / n_obs
+    mu = np.trace(sample) / n_assets
+    target = mu * np.eye(n_assets)
+
+    d2 = np.sum((sample - target) ** 2)
+    b2 = (np.sum(np.sum(x ** 2, axis=1) ** 2) - n_obs * np.sum(sample ** 2)) / n_obs ** 2
+    shrinkage = min(b2, d2) / d2 if d2 > 0 else 1.0
+    return shrinkage * target + (1 - shrinkage) * sample
+
+
+# EWMA-ковариация RiskMetrics (λ = 0.94, нулевое среднее)
+def ewma_covariance(returns, lam=0.94):
+    n_obs = len(returns)
+    weights = (1 - lam) * lam ** np.arange(n_obs - 1, -1, -1)
+    weights /= weights.sum()
+    return (returns * weights[:, None]).T @ returns
+
+
+# Факторная модель на главных компонентах: k факторов + диагональ остатков
+def factor_covariance(returns, n_factors=3):
+    sample = sample_covariance(returns)
+    n_factors = max(1, min(n_factors, len(sample) - 1))
+    eigenvalues, eigenvectors = np.linalg.eigh(sample)
+    top = eigenvectors[:, -n_factors:]
+    systematic = (top * eigenvalues[-n_factors:]) @ top.T
+    residual = np.clip(np.diag(sample) - np.diag(systematic), 0, None)
+    return systematic + np.diag(residual)
+
+
+_ESTIMATOR_FUNCS = {
+    'sample': sample_covariance,
+    'ledoit_wolf': ledoit_wolf_covariance,
+    'ewma': ewma_covariance,
+    'factor': factor_covariance,
+}
+
+
+# Оценка дневной ковариации доходностей тикеров из build_portfolio_df.
+# Результат вместе с разложением запоминается по (тикеры, даты, оценщик, параметры).
+def estimate_covariance(port_df, tickers, estimator='sample', **params):
+    if estimator not in _ESTIMATOR_FUNCS:
+        raise ValueError(f"Неизвестный оценщик ковариации: {estimator}")
+
+    return_cols = [f"{t}_Daily_Return" for t in tickers]
+    returns = port_df[return_cols].dropna()
+    if returns.empty:
+        raise ValueError("Нет данных для оценки ковариации")
+
+    key = (tuple(tickers), returns.index[0], returns.index[-1], len(returns),
+           estimator, tuple(sorted(params.items())))
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            instrumentation.record_cache('covariance', True)
+            return _cache[key]
+    instrumentation.record_cache('covariance', False)
+
+    with instrumentation.stage(f'portfolio.covariance.{estimator}'):
+        matrix = _ESTIMATOR_FUNCS[estimator](returns.to_numpy(dtype=float), **params)
+        estimate = CovarianceEstimate(matrix, tickers, estimator)
+
+    with _cache_lock:
+        _cache[key] = estimate
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return estimate
+
+
+def clear_covariance_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,184 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from portfolio.covariance import estimate_covariance
+from profiling import instrumentation
+
+METHODS = ('normal', 't', 'bootstrap')
+
+# Данные модели, общие для всех блоков (задаются один раз в каждом процессе)
+_model = {}
+
+
+def _init_worker(model):
+    _model.clear()
+    _model.update(model)
+
+
+# Один блок симуляции: дневные доходности активов генерируются по дням горизонта
+# и сразу накапливаются, в памяти только матрица (paths, N). Результат — доходность
+# портфеля за горизонт при покупке и удержании для каждого вектора весов.
+def _simulate_chunk(task):
+    seed, n_paths = task
+    rng = np.random.default_rng(seed)
+    mu, chol, history = _model['mu'], _model['chol'], _model['history']
+    method, vol_scale = _model['method'], _model['vol_scale']
+
+    growth = np.ones((n_paths, len(mu)))
+    for _ in range(_model['horizon']):
+        if method == 'bootstrap':
+            shocks = history[rng.integers(0, len(history), size=n_paths)] - mu
+        else:
+            shocks = rng.standard_normal((n_paths, len(mu))) @ chol.T
+            if method == 't':
+                nu = _model['df_t']
+                mixing = rng.chisquare(nu, size=(n_paths, 1)) / nu
+                shocks *= np.sqrt((nu - 2) / nu) / np.sqrt(mixing)
+        growth *= 1 + mu + vol_scale * shocks
+
+    return (growth - 1) @ _model['weights'].T
+
+
+# Хвост выборки: k наименьших доходностей по каждому вектору весов (по возрастанию)
+# и число значений, равных наибольшему из них, но не вошедших в хвост (повторы
+# при bootstrap), — по ним ES считается точно
+def _tail(values, k):
+    k = min(k, len(values))
+    tail = np.sort(np.partition(values, k - 1, axis=0)[:k], axis=0)
+    overflow = (values == tail[-1]).sum(axis=0) - (tail == tail[-1]).sum(axis=0)
+    return tail, overflow
+
+
+# Хвост объединения двух выборок по их хвостам
+def _merge_tails(a, b, k):
+    tail, overflow = _tail(np.concatenate([a[0], b[0]]), k)
+    for part_tail, part_overflow in (a, b):
+        overflow += np.where(part_tail[-1] == tail[-1], part_overflow, 0)
+    return tail, overflow
+
+
+# VaR (квантиль с линейной интерполяцией, как np.quantile) и ES по хвосту выборки
+# из n значений; хвост должен содержать не меньше ceil(alpha * n) + 1 значений
+def _tail_var_es(tail, overflow, n, alpha):
+    h = (n - 1) * alpha
+    lo = int(math.floor(h))
+    hi = min(lo + 1, len(tail) - 1)
+    var = tail[lo] + (h - lo) * (tail[hi] - tail[lo])
+    ties = np.where(tail[-1] <= var, overflow, 0)
+    in_tail = tail <= var
+    es = (np.where(in_tail, tail, 0.0).sum(axis=0) + ties * tail[-1]) / (in_tail.sum(axis=0) + ties)
+    return var, es
+
+
+# Размер хвоста, достаточный для VaR и ES уровня alpha по n путям
+def _tail_size(n, alpha):
+    return min(n, math.ceil(alpha * n) + 1)
+
+
+# Блок симуляции, сведённый к статистикам: VaR/ES самого блока и хвосты по каждому
+# уровню для объединения с другими блоками; сами пути — только при return_paths
+def _simulate_tails(task):
+    portfolio_returns = _simulate_chunk(task)
+    n_paths, alphas = _model['n_paths'], _model['alphas']
+    tails = [_tail(portfolio_returns, _tail_size(n_paths, alpha)) for alpha in alphas]
+    paths = portfolio_returns if _model['return_paths'] else None
+    return _tail_stats(portfolio_returns, alphas), tails, paths
+
+
+def _tail_stats(portfolio_returns, alphas):
+    var = np.quantile(portfolio_returns, alphas, axis=0)
+    es = np.empty_like(var)
+    for i, q in enumerate(var):
+        tail = np.where(portfolio_returns <= q, portfolio_returns, np.nan)
+        es[i] = np.nanmean(tail, axis=0)
+    return var, es
+
+
+# Monte Carlo VaR/ES портфеля по дневным доходностям активов из build_portfolio_df.
+# method: 'normal' (Холецкий), 't' (многомерное t с df_t степенями свободы),
+# 'bootstrap' (выборка исторических дней). Пути генерируются блоками по chunk_size
+# в пуле процессов; у каждого блока свой seed из SeedSequence, поэтому результат
+# не зависит от числа процессов. weights — вектор (N,) или матрица (K, N).
+# vol_scale > 1 задаёт стресс-сценарий с увеличенной волатильностью.
+# Блок сводится к хвосту из ceil(alpha * n_paths) + 1 наименьших доходностей на уровень,
+# поэтому память не растёт с n_paths целиком; все пути ('Portfolio Returns') — только
+# при return_paths=True.
+@instrumentation.timed('portfolio.monte_carlo')
+def simulate_portfolio_var(port_df, tickers, weights, n_paths=100_000, horizon=1, method='normal',
+                           confidence_levels=(0.95, 0.99), df_t=5, vol_scale=1.0,
+                           chunk_size=50_000, n_workers=None, seed=None, return_paths=False):
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод симуляции: {method}")
+    if method == 't' and df_t <= 2:
+        raise ValueError("Число степеней свободы t-распределения должно быть больше 2")
+
+    return_cols = [f"{t}_Daily_Return" for t in tickers]
+    missing = [c for c in return_cols if c not in port_df.columns]
+    if missing:
+        raise KeyError(f"Отсутствуют доходности: {missing}")
+
+    history = port_df[return_cols].dropna().to_numpy(dtype=float)
+    chol = estimate_covariance(port_df, tickers).chol if method != 'bootstrap' else None
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    if weights.shape[1] != len(tickers):
+        raise ValueError("Количество весов и тикеров не совпадает")
+
+    alphas = 1 - np.asarray(confidence_levels, dtype=float)
+    model = {
+        'mu': history.mean(axis=0),
+        'chol': chol,
+        'history': history,
+        'weights': weights,
+        'horizon': int(horizon),
+        'method': method,
+        'df_t': df_t,
+        'vol_scale': vol_scale,
+        'n_paths': int(n_paths),
+        'alphas': alphas,
+        'return_paths': return_paths,
+    }
+
+    sizes = [chunk_size] * (n_paths // chunk_size)
+    if n_paths % chunk_size:
+        sizes.append(n_paths % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = list(zip(seeds, sizes))
+
+    n_workers = n_workers or os.cpu_count() or 1
+    chunk_stats, tails, paths = [], None, []
+    # Хвосты блоков объединяются по мере готовности, пути блоков не накапливаются
+    def collect(results):
+        nonlocal tails
+        for stats, chunk_tails, chunk_paths in results:
+            chunk_stats.append(stats)
+            tails = chunk_tails if tails is None else [
+                _merge_tails(a, b, _tail_size(n_paths, alpha)) for a, b, alpha in zip(tails, chunk_tails, alphas)
+            ]
+            if chunk_paths is not None:
+                paths.append(chunk_paths)
+
+    if n_workers == 1 or len(tasks) == 1:
+        _init_worker(model)
+        collect(_simulate_tails(task) for task in tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(model,)) as pool:
+            collect(pool.map(_simulate_tails, tasks))
+
+    var, es = map(np.stack, zip(*[
+        _tail_var_es(tail, overflow, n_paths, alpha) for (tail, overflow), alpha in zip(tails, alphas)
+    ]))
+
+    # Разброс оценок VaR/ES между блоками — мера погрешности симуляции
+    result = {
+        'Confidence Levels': tuple(confidence_levels),
+        'VaR': var,
+        'ES': es,
+        'Chunk VaR': np.stack([v for v, _ in chunk_stats]),
+        'Chunk ES': np.stack([e for _, e in chunk_stats]),
+    }
+    if return_paths:
+        result['Portfolio Returns'] = np.concatenate(paths)
+    return result
@@ -0,0 +1,217 @@
+import bisect
+from collections import deque
+
+import numpy as np
+from scipy.stats import norm
+
+from portfolio.var_analysis import calculate_p_value
+
+
+# Среднее и дисперсия по всей истории (алгоритм Уэлфорда)
+class RunningMoments:
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+
+    @property
+    def var(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else float('nan')
+
+    @property
+    def std(self):
+        return self.var ** 0.5
+
+
+# Экспоненциальное среднее в форме pandas ewm: adjust=True — нормированная сумма весов,
+# adjust=False — рекурсия y = α·x + (1 − α)·y
+class EWMA:
+    def __init__(self, alpha, adjust=True):
+        self.alpha = alpha
+        self.adjust = adjust
+        self._num = 0.0
+        self._den = 0.0
+        self.value = float('nan')
+
+    def update(self, x):
+        decay = 1 - self.alpha
+        if self.adjust:
+            self._num = x + decay * self._num
+            self._den = 1 + decay * self._den
+            self.value = self._num / self._den
+        else:
+            self.value = x if self._den == 0 else self.alpha * x + decay * self.value
+            self._den = 1
+        return self.value
+
+
+# Скользящее окно в кольцевом буфере: сумма, сумма квадратов и упорядоченная копия окна
+# для квантилей (вставка и удаление — двоичным поиском)
+class RollingWindow:
+    def __init__(self, window):
+        self.window = window
+        self._values = deque(maxlen=window)
+        self._sorted = []
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+    def update(self, x):
+        if len(self._values) == self.window:
+            old = self._values[0]
+            self._sum -= old
+            self._sum_sq -= old * old
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+        self._values.append(x)
+        self._sum += x
+        self._sum_sq += x * x
+        bisect.insort(self._sorted, x)
+
+    @property
+    def full(self):
+        return len(self._values) == self.window
+
+    @property
+    def mean(self):
+        return self._sum / len(self._values)
+
+    # Стандартное отклонение окна с ddof=0 (как np.std в delta_normal_var)
+    @property
+    def std(self):
+        n = len(self._values)
+        return max(self._sum_sq / n - (self._sum / n) ** 2, 0.0) ** 0.5
+
+    # Квантиль с линейной интерполяцией (как np.percentile)
+    def quantile(self, q):
+        pos = q * (len(self._sorted) - 1)
+        lo = int(pos)
+        hi = min(lo + 1, len(self._sorted) - 1)
+        return self._sorted[lo] + (pos - lo) * (self._sorted[hi] - self._sorted[lo])
+
+
+# Потоковый аналог perform_var_analysis: каждое новое дневное значение доходности
+# обновляет состояние за O(1) (квантиль окна — O(log w) поиск + сдвиг списка).
+# Нарушения считаются так же, как в пакетном расчёте: доходность дня сравнивается
+# с VaR окна, включающего этот день.
+class OnlineRiskEngine:
+    def __init__(self, ma_window=50, lam=0.94, confidence_level=0.95):
+        self.ma_window = ma_window
+        self.confidence_level = confidence_level
+        self._z = norm.ppf(1 - confidence_level)
+        self.moments = RunningMoments()
+        self.window = RollingWindow(ma_window)
+        self.ewma = EWMA(2 / (ma_window + 1), adjust=False)
+        self.ewma_variance = EWMA(1 - lam, adjust=True)
+        self.violations_delta_normal = 0
+        self.violations_historical = 0
+        self.last = {}
+
+    def update(self, r):
+        self.moments.update(r)
+        self.window.update(r)
+        ewma = self.ewma.update(r)
+        ewma_variance = self.ewma_variance.update(r * r)
+
+        delta_normal_var = historical_var = moving_average = float('nan')
+        if self.window.full:
+            moving_average = self.window.mean
+            delta_normal_var = moving_average + self._z * self.window.std
+            historical_var = self.window.quantile(1 - self.confidence_level)
+            self.violations_delta_normal += int(r < delta_normal_var)
+            self.violations_historical += int(r < historical_var)
+
+        ewma_volatility = ewma_variance ** 0.5
+        self.last = {
+            'Portfolio_Return': r,
+            'MA': moving_average,
+            'EWMA': ewma,
+            'Delta-Normal VaR': delta_normal_var,
+            'Var Historical': historical_var,
+            'EWMA Variance': ewma_variance,
+            'EWMA Volatility': ewma_volatility,
+            'r/σ_EWMA': r / ewma_volatility if ewma_volatility else float('nan'),
+        }
+        return self.last
+
+    # VaR для следующего дня по текущему окну (без добавления новых данных)
+    def forecast(self):
+        if not self.window.full:
+            return {'Delta-Normal VaR': float('nan'), 'Var Historical': float('nan')}
+        return {
+            'Delta-Normal VaR': self.window.mean + self._z * self.window.std,
+            'Var Historical': self.window.quantile(1 - self.confidence_level),
+        }
+
+    # Сводка в формате results из perform_var_analysis
+    def results(self):
+        n_observations = self.moments.n
+        alpha = 1 - self.confidence_level
+        return {
+            'Violations, Delta-Normal VaR': self.violations_delta_normal,
+            'Violations, Historical VaR': self.violations_historical,
+            'Observations': n_observations,
+            'Expected Violations (5%)': n_observations * alpha,
+            'p-value, Delta-Normal VaR': calculate_p_value(self.violations_delta_normal, n_observations, alpha),
+            'p-value, Historical VaR': calculate_p_value(self.violations_historical, n_observations, alpha),
+            'Mean': self.moments.mean,
+            'Std': self.moments.std,
+        }
+
+
+# Внутридневной мониторинг одного портфеля по снимкам котировок.
+# Доходность дня пересчитывается на каждом снимке относительно цен закрытия
+# предыдущего дня и сравнивается с прогнозом VaR; при смене даты итог дня
+# фиксируется в движке риска.
+class PortfolioMonitor:
+    def __init__(self, name, tickers, weights, prev_close, history=None, engine=None):
+        self.name = name
+        self.tickers = list(tickers)
+        self.weights = np.asarray(weights, dtype=float)
+        self.prev_close = np.array([prev_close[t] for t in self.tickers], dtype=float)
+        self.last_prices = self.prev_close.copy()
+        self.engine = engine or OnlineRiskEngine()
+        self.current_date = None
+        self.intraday_return = 0.0
+
+        # Прогрев движка историей дневных доходностей портфеля
+        for r in history if history is not None else []:
+            self.engine.update(float(r))
+
+    def _close_day(self):
+        self.engine.update(self.intraday_return)
+        self.prev_close = self.last_prices.copy()
+        self.intraday_return = 0.0
+
+    def on_snapshot(self, snapshot):
+        if self.current_date is not None and snapshot['date'] != self.current_date:
+            self._close_day()
+        self.current_date = snapshot['date']
+
+        prices = snapshot['prices']
+        for i, t in enumerate(self.tickers):
+            price = prices.get(t)
+            if price is not None:
+                self.last_prices[i] = price
+
+        self.intraday_return = float(self.weights @ (self.last_prices / self.prev_close - 1))
+        forecast = self.engine.forecast()
+        return {
+            'Portfolio': self.name,
+            'Time': snapshot.get('time'),
+            'Intraday Return': self.intraday_return,
+            **forecast,
+            'Breach, Delta-Normal VaR': self.intraday_return < forecast['Delta-Normal VaR'],
+            'Breach, Historical VaR': self.intraday_return < forecast['Var Historical'],
+        }
+
+
+# Раздаёт поток снимков (loaders.marketdata.poll_marketdata / replay_marketdata)
+# всем портфелям; возвращает генератор статусов по каждому снимку
+def monitor_portfolios(monitors, snapshots):
+    for snapshot in snapshots:
+        yield [monitor.on_snapshot(snapshot) for monitor in monitors]
@@ -1,41 +1,141 @@
+import os
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from scipy.optimize import minimize
 
-def optimize_portfolio_weights(mean_returns_daily, cov_matrix_daily,
-                               target_volatility=0.20, init_guess=None):
-    num_assets = len(mean_returns_daily)
+from portfolio.covariance import CovarianceEstimate, cholesky_factor
+from profiling import instrumentation
 
-    # Преобразуем в годовые значения
-    mu = mean_returns_daily * 252
-    sigma = cov_matrix_daily * 252
+# Годовой множитель Холецкого: из готовой оценки ковариации или из дневной матрицы
+def _annual_cholesky(cov_matrix_daily):
+    if isinstance(cov_matrix_daily, CovarianceEstimate):
+        chol = cov_matrix_daily.chol
+    else:
+        chol = cholesky_factor(cov_matrix_daily)
+    return chol * np.sqrt(252)
+
+# Максимизация годовой доходности при ограничении на годовую волатильность.
+# Риск считается через разложение Холецкого: w^T Σ w = |L^T w|^2.
+# Градиенты целевой функции и ограничений заданы аналитически.
+def _solve_max_return(mu, chol, target_volatility, init_guess):
+    num_assets = len(mu)
 
     # Целевая функция: максимизируем доходность → минимизируем отрицательную
     def neg_portfolio_return(weights):
         return -np.dot(weights, mu)
 
+    def neg_portfolio_return_jac(weights):
+        return -mu
+
     # Ограничение на риск (годовая дисперсия ≤ целевой волатильности в квадрате)
     def risk_constraint(weights):
-        return target_volatility**2 - np.dot(weights.T, np.dot(sigma, weights))
+        projected = np.dot(weights, chol)
+        return target_volatility**2 - np.dot(projected, projected)
+
+    def risk_constraint_jac(weights):
+        return -2 * np.dot(chol, np.dot(weights, chol))
 
+    ones = np.ones(num_assets)
     constraints = [
-        {'type': 'eq', 'fun': lambda x: np.sum(x) - 1},        # сумма весов = 1
-        {'type': 'ineq', 'fun': risk_constraint}               # риск ≤ целевого
+        {'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: ones},    # сумма весов = 1
+        {'type': 'ineq', 'fun': risk_constraint, 'jac': risk_constraint_jac}      # риск ≤ целевого
     ]
 
     bounds = [(0, 1) for _ in range(num_assets)]  # без коротких продаж
 
-    if init_guess is None:
-        init_guess = np.array([1.0 / num_assets] * num_assets)
-
-    result = minimize(
+    return minimize(
         neg_portfolio_return,
-        init_guess,
+        np.asarray(init_guess, dtype=float),
+        jac=neg_portfolio_return_jac,
         method='SLSQP',
         bounds=bounds,
         constraints=constraints
     )
 
+@instrumentation.timed('portfolio.optimize')
+def optimize_portfolio_weights(mean_returns_daily, cov_matrix_daily,
+                               target_volatility=0.20, init_guess=None):
+    num_assets = len(mean_returns_daily)
+
+    # Преобразуем в годовые значения
+    mu = np.asarray(mean_returns_daily) * 252
+    chol = _annual_cholesky(cov_matrix_daily)
+
+    if init_guess is None:
+        init_guess = np.array([1.0 / num_assets] * num_assets)
+
+    result = _solve_max_return(mu, chol, target_volatility, init_guess)
+
     if not result.success:
         raise ValueError("Оптимизация не удалась, попробуй повысить уровень годовой волатильности")
 
     return result.x, -result.fun  # веса и ожидаемая доходность (годовая)
+
+# Последовательный проход по отсортированной сетке волатильностей:
+# каждая точка стартует из решения соседней
+def _solve_segment(args):
+    mu, chol, targets, init_guess = args
+    weights = np.full((len(targets), len(mu)), np.nan)
+    success = np.zeros(len(targets), dtype=bool)
+
+    guess = init_guess
+    for i, target in enumerate(targets):
+        result = _solve_max_return(mu, chol, target, guess)
+        if result.success:
+            weights[i] = result.x
+            success[i] = True
+            guess = result.x
+    return weights, success
+
+# Эффективная граница: максимальная доходность для каждой целевой годовой волатильности.
+# Недостижимые точки (волатильность ниже минимальной) помечаются success=False и NaN.
+# При n_workers > 1 сетка делится на непрерывные отрезки, которые решаются в пуле процессов.
+@instrumentation.timed('portfolio.efficient_frontier')
+def efficient_frontier(mean_returns_daily, cov_matrix_daily, target_volatilities,
+                       init_guess=None, n_workers=1):
+    num_assets = len(mean_returns_daily)
+    mu = np.asarray(mean_returns_daily) * 252
+    chol = _annual_cholesky(cov_matrix_daily)
+
+    targets = np.asarray(target_volatilities, dtype=float)
+    # Пустая сетка — пустая граница, пул процессов не создаётся
+    if not len(targets):
+        return {
+            'target_volatility': targets,
+            'weights': np.empty((0, num_assets)),
+            'returns': np.empty(0),
+            'volatility': np.empty(0),
+            'success': np.empty(0, dtype=bool),
+        }
+
+    order = np.argsort(targets)
+    sorted_targets = targets[order]
+
+    if init_guess is None:
+        init_guess = np.array([1.0 / num_assets] * num_assets)
+
+    n_workers = min(n_workers or os.cpu_count() or 1, len(targets)) or 1
+    segments = [s for s in np.array_split(sorted_targets, n_workers) if len(s)]
+    tasks = [(mu, chol, segment, init_guess) for segment in segments]
+
+    if len(tasks) == 1:
+        parts = [_solve_segment(tasks[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+            parts = list(pool.map(_solve_segment, tasks))
+
+    weights = np.empty((len(targets), num_assets))
+    success = np.empty(len(targets), dtype=bool)
+    weights[order] = np.concatenate([w for w, _ in parts])
+    success[order] = np.concatenate([s for _, s in parts])
+
+    returns = weights @ mu
+    volatilities = np.sqrt(np.sum((weights @ chol) ** 2, axis=1))
+
+    return {
+        'target_volatility': targets,
+        'weights': weights,
+        'returns': returns,
+        'volatility': volatilities,
+        'success': success,
+    }
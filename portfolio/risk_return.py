@@ -1,7 +1,19 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from profiling import instrumentation
+
+# risk_free_rate — годовая ставка: число или дневной ряд на индексе df
+# (например, из loaders.yield_curve.risk_free_series) для переменной во времени ставки
+@instrumentation.timed('portfolio.metrics')
 def calc_portfolio_metrics(df, risk_free_rate=0.0):
     avg_daily_return = df['Portfolio_Return'].mean()
     std_dev = df['Portfolio_Return'].std()
 
+    if isinstance(risk_free_rate, pd.Series):
+        risk_free_rate = risk_free_rate.reindex(df.index).ffill().bfill().mean()
+
     annualized_return = avg_daily_return * 252
     annualized_std = std_dev * (252 ** 0.5)
     sharpe_ratio = (annualized_return - risk_free_rate) / annualized_std if annualized_std != 0 else 0
@@ -10,4 +22,58 @@ def calc_portfolio_metrics(df, risk_free_rate=0.0):
         'avg_daily_return': avg_daily_return,
         'std_dev': std_dev,
         'sharpe_ratio': sharpe_ratio
-    }
\ No newline at end of file
+    }
+
+# Максимальный размер блока (T × K) при пакетном расчёте
+_CHUNK_ELEMENTS = 2_000_000
+
+# Метрики сразу для K портфелей: returns — матрица доходностей (T, N),
+# weights — матрица весов (K, N). Портфели обрабатываются блоками,
+# поэтому память не растёт с K. Возвращает DataFrame с K строками.
+@instrumentation.timed('portfolio.batch_metrics')
+def calc_batch_metrics(returns, weights, risk_free_rate=0.0, confidence_level=0.95):
+    returns = np.asarray(returns, dtype=float)
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    if returns.shape[1] != weights.shape[1]:
+        raise ValueError("Количество весов и активов не совпадает")
+
+    n_obs = len(returns)
+    alpha = 1 - confidence_level
+    columns = ['avg_daily_return', 'std_dev', 'sharpe_ratio', 'cumulative_return',
+               'max_drawdown', 'var_historical', 'var_delta_normal']
+    result = np.empty((len(weights), len(columns)))
+
+    # Порядковые статистики исторического VaR (линейная интерполяция, как np.percentile)
+    pos = alpha * (n_obs - 1)
+    lo = int(np.floor(pos))
+    hi = min(lo + 1, n_obs - 1)
+
+    step = max(1, _CHUNK_ELEMENTS // max(n_obs, 1))
+    for start in range(0, len(weights), step):
+        # Строка — портфель, столбец — день: все свёртки идут по непрерывной памяти
+        port = weights[start:start + step] @ returns.T
+        avg_daily_return = port.mean(axis=1)
+        std_dev = port.std(axis=1, ddof=1)
+
+        annualized_return = avg_daily_return * 252
+        annualized_std = std_dev * (252 ** 0.5)
+        sharpe_ratio = np.divide(annualized_return - risk_free_rate, annualized_std,
+                                 out=np.zeros_like(annualized_std), where=annualized_std != 0)
+
+        wealth = np.cumprod(1 + port, axis=1)
+        drawdown = wealth / np.maximum(np.maximum.accumulate(wealth, axis=1), 1.0) - 1
+
+        ordered = np.partition(port, [lo, hi], axis=1)
+        var_historical = ordered[:, lo] + (pos - lo) * (ordered[:, hi] - ordered[:, lo])
+
+        result[start:start + step] = np.column_stack([
+            avg_daily_return,
+            std_dev,
+            sharpe_ratio,
+            wealth[:, -1] - 1,
+            np.minimum(drawdown.min(axis=1), 0.0),
+            var_historical,
+            avg_daily_return + std_dev * norm.ppf(alpha),
+        ])
+
+    return pd.DataFrame(result, columns=columns)
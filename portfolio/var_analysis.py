@@ -1,6 +1,8 @@
 import numpy as np
 from scipy.stats import norm, binom
 
+from profiling import instrumentation
+
 # Биномиальный тест на количество нарушений
 def calculate_p_value(violations, n_observations, p=0.05):
     return 1 - binom.cdf(violations - 1, n_observations, p)
@@ -12,7 +14,18 @@ def delta_normal_var(returns, confidence_level=0.95):
     var = norm.ppf(1 - confidence_level, mean, std_dev)
     return var
 
+# Скользящий дельта-нормальный VaR: mean + z·std по окну (std с ddof=0, как np.std)
+def rolling_delta_normal_var(returns, window, confidence_level=0.95):
+    z = norm.ppf(1 - confidence_level)
+    rolling = returns.rolling(window=window)
+    return rolling.mean() + z * rolling.std(ddof=0)
+
+# Скользящий исторический VaR: квантиль окна (линейная интерполяция, как np.percentile)
+def rolling_historical_var(returns, window, confidence_level=0.95):
+    return returns.rolling(window=window).quantile(1 - confidence_level, interpolation='linear')
+
 # Расчёт Value-at-Risk для портфеля
+@instrumentation.timed('portfolio.var_analysis')
 def perform_var_analysis(df, ma_window=50):
     df = df.copy()
 
@@ -21,8 +34,8 @@ def perform_var_analysis(df, ma_window=50):
     df['EWMA'] = df['Portfolio_Return'].ewm(span=ma_window, adjust=False).mean()
 
     # VaR-модели
-    df['Delta-Normal VaR'] = df['Portfolio_Return'].rolling(window=ma_window).apply(delta_normal_var)
-    df['Var Historical'] = df['Portfolio_Return'].rolling(window=ma_window).apply(lambda x: np.percentile(x, 5))
+    df['Delta-Normal VaR'] = rolling_delta_normal_var(df['Portfolio_Return'], ma_window)
+    df['Var Historical'] = rolling_historical_var(df['Portfolio_Return'], ma_window)
 
     # Нарушения (violations)
     violations_ma = (df['Portfolio_Return'] < df['Delta-Normal VaR']).sum()
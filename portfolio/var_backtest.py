@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.special import xlogy
+from scipy.stats import chi2, norm
+
+from profiling import instrumentation
+
+CONFIDENCE_LEVELS = (0.90, 0.95, 0.99, 0.995)
+MODELS = ('Historical', 'Delta-Normal', 'EWMA', 'Cornish-Fisher', 'FHS')
+
+# Максимальное число элементов во временном блоке окон (ограничивает память)
+_CHUNK_ELEMENTS = 4_000_000
+
+# Узлы для усреднения квантилей хвоста при расчёте ES Корниша-Фишера
+_TAIL_NODES = 16
+
+
+def _as_matrix(returns):
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+    if isinstance(returns, pd.DataFrame):
+        return returns.to_numpy(dtype=float), list(returns.columns)
+    values = np.asarray(returns, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values, list(range(values.shape[1]))
+
+
+# Квантили (линейная интерполяция, как np.percentile) и ES скользящих окон
+# для всех уровней сразу. Прогноз на день t строится по окну [t-window, t-1].
+def rolling_tail_stats(values, window, alphas):
+    n_obs, n_cols = values.shape
+    var = np.full((len(alphas), n_obs, n_cols), np.nan)
+    es = np.full((len(alphas), n_obs, n_cols), np.nan)
+    if n_obs <= window:
+        return var, es
+
+    pos = np.asarray(alphas) * (window - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, window - 1)
+    frac = pos - lo
+    n_tail = np.maximum(1, np.ceil(np.asarray(alphas) * window).astype(int))
+    # Нужны только порядковые статистики хвоста: одно разбиение по самой дальней
+    # из них, затем полная сортировка короткого хвоста
+    k_max = int(max(hi.max(), n_tail.max() - 1))
+
+    windows = sliding_window_view(values[:-1], window, axis=0)
+    step = max(1, _CHUNK_ELEMENTS // (window * n_cols))
+    for start in range(0, len(windows), step):
+        block = windows[start:start + step]
+        if k_max < window - 1:
+            block = np.partition(block, k_max, axis=-1)[..., :k_max + 1]
+        block = np.sort(block, axis=-1)
+        rows = slice(window + start, window + start + len(block))
+        tail_sums = np.cumsum(block[..., :n_tail.max()], axis=-1)
+        for i in range(len(alphas)):
+            var[i, rows] = block[..., lo[i]] + frac[i] * (block[..., hi[i]] - block[..., lo[i]])
+            es[i, rows] = tail_sums[..., n_tail[i] - 1] / n_tail[i]
+    return var, es
+
+
+# Прогнозы VaR и ES всех моделей. Общие величины (скользящие моменты, EWMA-дисперсия,
+# упорядоченные окна) считаются один раз и переиспользуются для всех моделей и уровней.
+def var_forecasts(returns, window=250, confidence_levels=CONFIDENCE_LEVELS, lam=0.94, models=MODELS):
+    values, _ = _as_matrix(returns)
+    frame = pd.DataFrame(values)
+    alphas = 1 - np.asarray(confidence_levels, dtype=float)
+    z = norm.ppf(alphas)[:, None, None]
+    forecasts = {}
+
+    rolling = frame.rolling(window=window)
+    mean = rolling.mean().shift(1).to_numpy()[None]
+    std = rolling.std().shift(1).to_numpy()[None]
+
+    if 'Historical' in models:
+        var, es = rolling_tail_stats(values, window, alphas)
+        forecasts['Historical'] = {'VaR': var, 'ES': es}
+
+    if 'Delta-Normal' in models:
+        pdf_ratio = (norm.pdf(z) / alphas[:, None, None])
+        forecasts['Delta-Normal'] = {'VaR': mean + z * std, 'ES': mean - std * pdf_ratio}
+
+    # EWMA-дисперсия (λ = 0.94), как в perform_var_analysis, со сдвигом на день
+    ewma_vol = np.sqrt(frame.pow(2).ewm(alpha=(1 - lam)).mean().shift(1).to_numpy())
+    if 'EWMA' in models:
+        pdf_ratio = (norm.pdf(z) / alphas[:, None, None])
+        forecasts['EWMA'] = {'VaR': z * ewma_vol[None], 'ES': -ewma_vol[None] * pdf_ratio}
+
+    if 'Cornish-Fisher' in models:
+        skew = rolling.skew().shift(1).to_numpy()[None]
+        kurt = rolling.kurt().shift(1).to_numpy()[None]
+
+        def cf_quantile(zq):
+            return (zq + (zq ** 2 - 1) * skew / 6 + (zq ** 3 - 3 * zq) * kurt / 24
+                    - (2 * zq ** 3 - 5 * zq) * skew ** 2 / 36)
+
+        # ES как среднее квантилей Корниша-Фишера по хвосту (0, α)
+        nodes = (np.arange(_TAIL_NODES) + 0.5) / _TAIL_NODES
+        tail_z = sum(cf_quantile(norm.ppf(alphas * u)[:, None, None]) for u in nodes) / _TAIL_NODES
+        forecasts['Cornish-Fisher'] = {
+            'VaR': mean + cf_quantile(z) * std,
+            'ES': mean + tail_z * std,
+        }
+
+    # Filtered historical simulation: квантили стандартизованных остатков r / σ_EWMA
+    if 'FHS' in models:
+        residuals = values / np.where(ewma_vol > 0, ewma_vol, np.nan)
+        residuals[0] = 0.0
+        var_z, es_z = rolling_tail_stats(residuals, window, alphas)
+        var_z[:, :window + 1] = np.nan
+        es_z[:, :window + 1] = np.nan
+        forecasts['FHS'] = {'VaR': var_z * ewma_vol[None], 'ES': es_z * ewma_vol[None]}
+
+    return forecasts
+
+
+# Тест Купика (POF) и тесты Кристофферсена (независимость, условное покрытие).
+# hits: булева матрица нарушений (..., T), valid: маска наблюдений с прогнозом.
+def coverage_tests(hits, valid, alpha):
+    alpha = np.asarray(alpha, dtype=float)
+    hits = hits & valid
+    n = valid.sum(axis=-1)
+    x = hits.sum(axis=-1)
+    rate = np.divide(x, n, out=np.zeros(x.shape), where=n > 0)
+
+    lr_pof = -2 * (xlogy(n - x, 1 - alpha) + xlogy(x, alpha)
+                   - xlogy(n - x, 1 - rate) - xlogy(x, rate))
+
+    pairs = valid[..., 1:] & valid[..., :-1]
+    prev, curr = hits[..., :-1], hits[..., 1:]
+    n00 = (pairs & ~prev & ~curr).sum(axis=-1)
+    n01 = (pairs & ~prev & curr).sum(axis=-1)
+    n10 = (pairs & prev & ~curr).sum(axis=-1)
+    n11 = (pairs & prev & curr).sum(axis=-1)
+
+    def share(a, b):
+        return np.divide(a, a + b, out=np.zeros(a.shape), where=(a + b) > 0)
+
+    pi0, pi1, pi = share(n01, n00), share(n11, n10), share(n01 + n11, n00 + n10)
+    lr_ind = -2 * (xlogy(n00 + n10, 1 - pi) + xlogy(n01 + n11, pi)
+                   - xlogy(n00, 1 - pi0) - xlogy(n01, pi0)
+                   - xlogy(n10, 1 - pi1) - xlogy(n11, pi1))
+    lr_cc = lr_pof + lr_ind
+
+    return {
+        'Observations': n,
+        'Violations': x,
+        'Violation Rate': rate,
+        'LR POF': lr_pof,
+        'p-value POF': chi2.sf(lr_pof, 1),
+        'LR Independence': lr_ind,
+        'p-value Independence': chi2.sf(lr_ind, 1),
+        'LR Conditional Coverage': lr_cc,
+        'p-value Conditional Coverage': chi2.sf(lr_cc, 2),
+    }
+
+
+# Бэктест VaR/ES для матрицы доходностей (столбцы — портфели) по всем моделям
+# и уровням доверия за один проход. Возвращает прогнозы и сводную таблицу тестов.
+@instrumentation.timed('portfolio.var_backtest')
+def backtest_var(returns, window=250, confidence_levels=CONFIDENCE_LEVELS, lam=0.94, models=MODELS):
+    values, columns = _as_matrix(returns)
+    confidence_levels = tuple(confidence_levels)
+    alphas = 1 - np.asarray(confidence_levels, dtype=float)
+    forecasts = var_forecasts(values, window, confidence_levels, lam, models)
+
+    realized = values.T[None]
+    tables = []
+    for model, forecast in forecasts.items():
+        var = np.moveaxis(forecast['VaR'], 1, 2)
+        es = np.moveaxis(forecast['ES'], 1, 2)
+        valid = ~np.isnan(var) & ~np.isnan(realized)
+        tests = coverage_tests(realized < var, valid, alphas[:, None])
+
+        level_idx, col_idx = np.meshgrid(np.arange(len(alphas)), np.arange(len(columns)), indexing='ij')
+        table = pd.DataFrame({name: np.ravel(value) for name, value in tests.items()})
+        table.insert(0, 'Portfolio', np.asarray(columns, dtype=object)[col_idx.ravel()])
+        table.insert(0, 'Confidence', np.asarray(confidence_levels)[level_idx.ravel()])
+        table.insert(0, 'Model', model)
+        table.insert(5, 'Expected Violations', table['Observations'] * alphas[level_idx.ravel()])
+        table['Mean VaR'] = np.ravel(np.nanmean(np.where(valid, var, np.nan), axis=-1))
+        table['Mean ES'] = np.ravel(np.nanmean(np.where(valid, es, np.nan), axis=-1))
+        tables.append(table)
+
+    summary = pd.concat(tables, ignore_index=True)
+    return forecasts, summary
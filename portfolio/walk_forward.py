@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+from portfolio.optimizer import optimize_portfolio_weights
+from profiling import instrumentation
+
+# Частота ребалансировки → частота периода pandas (ребалансировка в последний торговый день периода)
+REBALANCE_FREQUENCIES = {'monthly': 'M', 'quarterly': 'Q'}
+WINDOW_MODES = ('rolling', 'expanding')
+
+
+# Суммы доходностей и их попарных произведений по окну оценки. При сдвиге окна
+# добавляются только новые дни и вычитаются выпавшие, без пересчёта всего окна.
+class WindowMoments:
+    def __init__(self, n_assets):
+        self.n = 0
+        self.sum = np.zeros(n_assets)
+        self.sum_sq = np.zeros((n_assets, n_assets))
+
+    def add(self, block):
+        if len(block):
+            self.n += len(block)
+            self.sum += block.sum(axis=0)
+            self.sum_sq += block.T @ block
+
+    def remove(self, block):
+        if len(block):
+            self.n -= len(block)
+            self.sum -= block.sum(axis=0)
+            self.sum_sq -= block.T @ block
+
+    def mean(self):
+        return self.sum / self.n
+
+    # Выборочная ковариация (ddof=1, как sample_covariance)
+    def covariance(self):
+        mean = self.mean()
+        cov = (self.sum_sq - self.n * np.outer(mean, mean)) / (self.n - 1)
+        return (cov + cov.T) / 2
+
+
+# Позиции последних торговых дней каждого месяца/квартала в индексе
+def rebalance_positions(index, rebalance='monthly'):
+    if rebalance not in REBALANCE_FREQUENCIES:
+        raise ValueError(f"Неизвестная частота ребалансировки: {rebalance}")
+    periods = pd.DatetimeIndex(index).to_period(REBALANCE_FREQUENCIES[rebalance])
+    return np.flatnonzero(np.append(periods[1:] != periods[:-1], True))
+
+
+# Walk-forward бэктест: в конце каждого периода среднее и ковариация оцениваются по окну
+# window дней (rolling) или по всей истории (expanding), веса переоптимизируются
+# (максимум доходности при целевой волатильности) со стартом из предыдущего решения.
+# Между ребалансировками веса дрейфуют вместе с ценами; при ребалансировке стоимость
+# портфеля уменьшается на transaction_cost · оборот (сумма |Δw|). Если оптимизация
+# не удалась, позиции сохраняются без сделок (до первой удачной оптимизации — в деньгах).
+@instrumentation.timed('portfolio.walk_forward')
+def walk_forward_backtest(port_df, tickers, target_volatility=0.20, rebalance='monthly', window=252,
+                          window_mode='rolling', transaction_cost=0.001, min_history=None):
+    if window_mode not in WINDOW_MODES:
+        raise ValueError(f"Неизвестный режим окна: {window_mode}")
+
+    return_cols = [f"{t}_Daily_Return" for t in tickers]
+    missing = [c for c in return_cols if c not in port_df.columns]
+    if missing:
+        raise KeyError(f"Отсутствуют доходности: {missing}")
+
+    returns_df = port_df[return_cols].dropna()
+    returns = returns_df.to_numpy(dtype=float)
+    n_days, n_assets = returns.shape
+    min_history = min_history or window
+    positions = [p for p in rebalance_positions(returns_df.index, rebalance) if min_history <= p + 1 < n_days]
+    if not positions:
+        raise ValueError(f"Недостаточно данных для walk-forward: нужно больше {min_history} дней")
+
+    moments = WindowMoments(n_assets)
+    start = end = 0
+    holdings = np.zeros(n_assets)          # фактические веса (в начале — деньги)
+    weights = np.full(n_assets, 1.0 / n_assets)
+    value = 1.0
+    values = np.full(n_days, np.nan)
+    log, target_rows = [], []
+
+    for i, pos in enumerate(positions):
+        # Окно оценки [start, end) заканчивается днём ребалансировки включительно
+        new_end = pos + 1
+        new_start = max(0, new_end - window) if window_mode == 'rolling' else 0
+        moments.add(returns[end:new_end])
+        moments.remove(returns[start:new_start])
+        start, end = new_start, new_end
+
+        try:
+            target, expected_return = optimize_portfolio_weights(
+                moments.mean(), moments.covariance(), target_volatility=target_volatility, init_guess=weights
+            )
+            target = np.clip(target, 0, None)
+            target /= target.sum()
+            success = True
+        except ValueError:
+            target = holdings
+            expected_return, success = np.nan, False
+
+        turnover = np.abs(target - holdings).sum()
+        cost = transaction_cost * turnover
+        value *= 1 - cost
+        values[pos] = value
+
+        # Дрейф до следующей ребалансировки: стоимость — w · накопленный рост каждого актива
+        # плюс не вложенная доля (деньги)
+        seg_end = positions[i + 1] + 1 if i + 1 < len(positions) else n_days
+        growth = np.cumprod(1 + returns[pos + 1:seg_end], axis=0)
+        cash = 1 - target.sum()
+        segment_values = value * (growth @ target + cash)
+        values[pos + 1:seg_end] = segment_values
+        holdings = target * growth[-1] / (growth[-1] @ target + cash)
+        value = segment_values[-1]
+        if success:
+            weights = target
+
+        target_rows.append(target)
+        log.append({
+            'Date': returns_df.index[pos],
+            'Window': end - start,
+            'Turnover': turnover,
+            'Cost': cost,
+            'Expected Return': expected_return,
+            'Success': success,
+        })
+
+    index = returns_df.index
+    value_series = pd.Series(values, index=index, name='Portfolio_Value').dropna()
+    rebalance_dates = index[positions]
+    return {
+        'values': value_series,
+        'returns': value_series.pct_change().dropna().rename('Portfolio_Return'),
+        'weights': pd.DataFrame(target_rows, index=rebalance_dates, columns=list(tickers)),
+        'rebalances': pd.DataFrame(log),
+    }
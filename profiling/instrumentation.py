@@ -0,0 +1,204 @@
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import nullcontext
+
+# Сбор статистики включается переменной окружения PORTFOLIO_PROFILE=1 или enable().
+# В выключенном состоянии stage()/timed() сводятся к проверке одного флага.
+_enabled = os.environ.get("PORTFOLIO_PROFILE", "") not in ("", "0")
+
+_lock = threading.Lock()
+_stages = {}   # этап → [вызовы, wall, cpu, max wall]
+_http = {}     # endpoint → [запросы, ошибки, байты, суммарная задержка, max задержка]
+_caches = {}   # кэш → [попадания, промахи]
+_frames = {}   # DataFrame → {'rows', 'columns', 'bytes'}
+
+_NULL_CONTEXT = nullcontext()
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _http.clear()
+        _caches.clear()
+        _frames.clear()
+
+
+class _Stage:
+    __slots__ = ('name', '_wall', '_cpu')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        with _lock:
+            entry = _stages.setdefault(self.name, [0, 0.0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += wall
+            entry[2] += cpu
+            entry[3] = max(entry[3], wall)
+
+
+# Замер этапа: with stage('portfolio.var_analysis'): ...
+def stage(name):
+    return _Stage(name) if _enabled else _NULL_CONTEXT
+
+
+# Декоратор для замера функции как этапа
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Путь ISS без параметров; код бумаги заменяется на *, чтобы группировать по endpoint
+def endpoint_name(url):
+    path = re.sub(r'^https?://[^/]+', '', url.split('?', 1)[0])
+    return re.sub(r'/securities/[^/]+\.json$', '/securities/*.json', path)
+
+
+def record_http(url, seconds, n_bytes=0, ok=True):
+    if not _enabled:
+        return
+    name = endpoint_name(url)
+    with _lock:
+        entry = _http.setdefault(name, [0, 0, 0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += 0 if ok else 1
+        entry[2] += n_bytes
+        entry[3] += seconds
+        entry[4] = max(entry[4], seconds)
+
+
+def record_cache(name, hit):
+    if not _enabled:
+        return
+    with _lock:
+        entry = _caches.setdefault(name, [0, 0])
+        entry[0 if hit else 1] += 1
+
+
+def record_frame(name, df):
+    if not _enabled or df is None:
+        return
+    with _lock:
+        _frames[name] = {
+            'rows': int(df.shape[0]),
+            'columns': int(df.shape[1]) if df.ndim > 1 else 1,
+            'bytes': int(df.memory_usage(index=True).sum()) if df.ndim > 1 else int(df.memory_usage(index=True)),
+        }
+
+
+def snapshot():
+    with _lock:
+        return {
+            'stages': {
+                name: {'calls': c, 'wall_seconds': w, 'cpu_seconds': cpu, 'max_wall_seconds': m}
+                for name, (c, w, cpu, m) in sorted(_stages.items())
+            },
+            'http': {
+                name: {'requests': n, 'errors': e, 'bytes': b,
+                       'latency_seconds': lat, 'mean_latency_seconds': lat / n if n else 0.0,
+                       'max_latency_seconds': m}
+                for name, (n, e, b, lat, m) in sorted(_http.items())
+            },
+            'caches': {
+                name: {'hits': h, 'misses': m, 'hit_rate': h / (h + m) if h + m else 0.0}
+                for name, (h, m) in sorted(_caches.items())
+            },
+            'frames': {name: dict(info) for name, info in sorted(_frames.items())},
+        }
+
+
+# Добавляет снимок snapshot() другого процесса (например, рабочего процесса пула)
+def merge(data):
+    with _lock:
+        for name, v in data.get('stages', {}).items():
+            entry = _stages.setdefault(name, [0, 0.0, 0.0, 0.0])
+            entry[0] += v['calls']
+            entry[1] += v['wall_seconds']
+            entry[2] += v['cpu_seconds']
+            entry[3] = max(entry[3], v['max_wall_seconds'])
+        for name, v in data.get('http', {}).items():
+            entry = _http.setdefault(name, [0, 0, 0, 0.0, 0.0])
+            entry[0] += v['requests']
+            entry[1] += v['errors']
+            entry[2] += v['bytes']
+            entry[3] += v['latency_seconds']
+            entry[4] = max(entry[4], v['max_latency_seconds'])
+        for name, v in data.get('caches', {}).items():
+            entry = _caches.setdefault(name, [0, 0])
+            entry[0] += v['hits']
+            entry[1] += v['misses']
+        for name, v in data.get('frames', {}).items():
+            _frames[name] = dict(v)
+
+
+def to_json(path=None):
+    text = json.dumps(snapshot(), ensure_ascii=False, indent=2)
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return text
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+# Текстовый формат Prometheus (exposition format 0.0.4)
+def to_prometheus(path=None):
+    data = snapshot()
+    metrics = [
+        ('portfolio_stage_calls_total', 'counter', 'stage', 'stages', 'calls'),
+        ('portfolio_stage_wall_seconds_total', 'counter', 'stage', 'stages', 'wall_seconds'),
+        ('portfolio_stage_cpu_seconds_total', 'counter', 'stage', 'stages', 'cpu_seconds'),
+        ('portfolio_stage_max_wall_seconds', 'gauge', 'stage', 'stages', 'max_wall_seconds'),
+        ('portfolio_http_requests_total', 'counter', 'endpoint', 'http', 'requests'),
+        ('portfolio_http_errors_total', 'counter', 'endpoint', 'http', 'errors'),
+        ('portfolio_http_response_bytes_total', 'counter', 'endpoint', 'http', 'bytes'),
+        ('portfolio_http_latency_seconds_total', 'counter', 'endpoint', 'http', 'latency_seconds'),
+        ('portfolio_http_max_latency_seconds', 'gauge', 'endpoint', 'http', 'max_latency_seconds'),
+        ('portfolio_cache_hits_total', 'counter', 'cache', 'caches', 'hits'),
+        ('portfolio_cache_misses_total', 'counter', 'cache', 'caches', 'misses'),
+        ('portfolio_frame_rows', 'gauge', 'frame', 'frames', 'rows'),
+        ('portfolio_frame_columns', 'gauge', 'frame', 'frames', 'columns'),
+        ('portfolio_frame_bytes', 'gauge', 'frame', 'frames', 'bytes'),
+    ]
+    lines = []
+    for metric, kind, label, section, field in metrics:
+        if not data[section]:
+            continue
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, values in data[section].items():
+            lines.append(f'{metric}{{{label}="{_escape(name)}"}} {values[field]}')
+    text = "\n".join(lines) + "\n"
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return text
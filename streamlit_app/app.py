@@ -3,29 +3,40 @@ import datetime as dt
 from ui import (
     get_user_inputs, get_weights_ui, plot_portfolio_return, display_metrics,
     plot_return_distribution, display_asset_statistics, plot_correlation_heatmap,
-    plot_volatility_function, plot_var_analysis, display_var_results
+    plot_volatility_function, plot_var_analysis, display_var_results, display_profiling_panel
 )
-from loaders.moex_loader import get_moex_data_and_prepare
+from loaders.moex_loader import fetch_many
 from loaders.risk_free_rate import get_risk_free_rate
-from portfolio.constructor import build_portfolio_df
+from portfolio.constructor import build_panel, build_portfolio_df
 from portfolio.risk_return import calc_portfolio_metrics
 from portfolio.optimizer import optimize_portfolio_weights
+from portfolio.covariance import estimate_covariance
 from portfolio.var_analysis import perform_var_analysis
+from pipeline_cache import cached_stage
+from profiling import instrumentation
 
 import numpy as np
 import copy
 
-# Загружает исторические данные по каждому тикеру
+# Загружает исторические данные по каждому тикеру; результат с пустыми рядами
+# (ошибка загрузки или нет истории) в общий кэш не попадает и запрашивается снова
 def fetch_data(tickers, start_date, end_date):
+    frames = cached_stage('fetch', (tickers, start_date, end_date), fetch_many, tickers, start_date, end_date,
+                          resolve=True, cache_if=lambda frames: not any(df.empty for df in frames))
     dfs = []
-    for t in tickers:
-        df = get_moex_data_and_prepare(t, start_date, end_date)
+    for t, df in zip(tickers, frames):
         if not df.empty:
             dfs.append(df)
         else:
             st.warning(f"Нет данных для {t}")
     return dfs
 
+# Метрики портфеля вместе с доходностью за период
+def portfolio_metrics(port_df, risk_free_rate):
+    metrics = calc_portfolio_metrics(port_df, risk_free_rate)
+    metrics['cumulative_return'] = (1 + port_df['Portfolio_Return']).prod() - 1
+    return metrics
+
 # Основная функция запуска приложения
 def main():
     st.set_page_config(layout="wide", page_title="Анализ портфеля")
@@ -37,11 +48,13 @@ def main():
         st.info("Выберите хотя бы один тикер")
         return
 
-    # Сброс сохраненного состояния, если изменился список тикеров
-    if 'tickers' in st.session_state and st.session_state.tickers != tickers:
+    # Сброс сохраненного состояния, если изменился список тикеров или период
+    if 'tickers' in st.session_state and (
+        st.session_state.tickers != tickers or st.session_state.get('dates') != (start_date, end_date)
+    ):
         keys_to_clear = [
-            'dfs', 'port_df', 'opt_port_df', 'metrics', 'opt_metrics',
-            'weights', 'opt_weights', 'history'
+            'dfs', 'panel', 'port_df', 'opt_port_df', 'metrics', 'opt_metrics',
+            'weights', 'opt_weights', 'history', 'dates'
         ]
         for k in keys_to_clear:
             st.session_state.pop(k, None)
@@ -59,30 +72,47 @@ def main():
         st.error("Сумма весов должна быть 1.0")
         return
 
+    # Этапы анализа берутся из общего кэша процесса по ключу (тикеры, даты, веса, параметры),
+    # поэтому повторный запуск скрипта без изменения этих значений ничего не пересчитывает
+    data_key = (tickers, start_date, end_date)
+
     # Загрузка и анализ при первом запуске или обновлении
     if st.button("Загрузить и проанализировать") or 'port_df' in st.session_state:
         if 'dfs' not in st.session_state:
             st.session_state.dfs = fetch_data(tickers, start_date, end_date)
 
         if st.session_state.dfs:
-            st.session_state.port_df = build_portfolio_df(st.session_state.dfs, tickers, weights)
-            st.session_state.rf = get_risk_free_rate(start_date.strftime("%Y-%m-%d")) or 0.0
-            st.session_state.metrics = calc_portfolio_metrics(st.session_state.port_df, st.session_state.rf)
-            st.session_state.metrics['cumulative_return'] = (1 + st.session_state.port_df['Portfolio_Return']).prod() - 1
+            st.session_state.panel = cached_stage('panel', data_key, build_panel, st.session_state.dfs, tickers)
+            st.session_state.port_df = cached_stage(
+                'portfolio', (data_key, weights), build_portfolio_df, st.session_state.panel, tickers, weights
+            )
+            st.session_state.rf = cached_stage(
+                'risk_free_rate', (start_date,), get_risk_free_rate, start_date.strftime("%Y-%m-%d")
+            ) or 0.0
+            instrumentation.record_frame('app.panel', st.session_state.panel.frame)
+            instrumentation.record_frame('app.port_df', st.session_state.port_df)
+            st.session_state.metrics = cached_stage(
+                'metrics', (data_key, weights, st.session_state.rf),
+                portfolio_metrics, st.session_state.port_df, st.session_state.rf
+            )
             st.session_state.tickers = tickers
+            st.session_state.dates = (start_date, end_date)
             st.session_state.weights = weights
 
     # Отображение аналитики по построенному портфелю
     if 'port_df' in st.session_state:
-        plot_portfolio_return(st.session_state.port_df, key_suffix="fact")
-        plot_return_distribution(st.session_state.port_df, key="fact")
+        # Графики и статистика при движении ползунков тоже берутся из кэша по (данные, веса)
+        port_key = (data_key, st.session_state.weights)
+        plot_portfolio_return(st.session_state.port_df, key_suffix="fact", cache_key=port_key)
+        plot_return_distribution(st.session_state.port_df, key="fact", cache_key=port_key)
         display_metrics(st.session_state.metrics)
-        display_asset_statistics(st.session_state.port_df, st.session_state.tickers, st.session_state.rf)
-        plot_correlation_heatmap(st.session_state.port_df)
+        display_asset_statistics(st.session_state.port_df, st.session_state.tickers, st.session_state.rf,
+                                 cache_key=port_key)
+        plot_correlation_heatmap(st.session_state.port_df, cache_key=port_key)
 
         # Анализ рисков по Value-at-Risk
-        var_data, var_results, ma_window = perform_var_analysis(st.session_state.port_df)
-        plot_var_analysis(var_data, ma_window)
+        var_data, var_results, ma_window = cached_stage('var', port_key, perform_var_analysis, st.session_state.port_df)
+        plot_var_analysis(var_data, ma_window, cache_key=port_key)
         display_var_results(var_data, var_results, ma_window)
 
         # Ввод целевой волатильности
@@ -94,24 +124,27 @@ def main():
         # Кнопка оптимизации
         if st.button("Оптимизировать портфель"):
             mean_returns = st.session_state.port_df[[f"{t}_Daily_Return" for t in st.session_state.tickers]].mean()
-            cov_matrix = st.session_state.port_df[[f"{t}_Daily_Return" for t in st.session_state.tickers]].cov()
+            cov_estimate = estimate_covariance(st.session_state.port_df, st.session_state.tickers)
             init_guess = copy.deepcopy(st.session_state.weights)
 
             # Оптимизация по целевой волатильности
-            opt_weights, max_return = optimize_portfolio_weights(
+            opt_weights, max_return = cached_stage(
+                'optimize', (data_key, init_guess, target_volatility),
+                optimize_portfolio_weights,
                 mean_returns.values,
-                cov_matrix.values,
+                cov_estimate,
                 target_volatility=target_volatility,
                 init_guess=init_guess
             )
 
             st.session_state.opt_weights = opt_weights
-            st.session_state.opt_port_df = build_portfolio_df(
-                st.session_state.dfs, st.session_state.tickers, opt_weights
+            st.session_state.opt_port_df = cached_stage(
+                'portfolio', (data_key, opt_weights), build_portfolio_df,
+                st.session_state.panel, st.session_state.tickers, opt_weights
             )
-            st.session_state.opt_metrics = calc_portfolio_metrics(st.session_state.opt_port_df, st.session_state.rf)
-            st.session_state.opt_metrics['cumulative_return'] = (
-                (1 + st.session_state.opt_port_df['Portfolio_Return']).prod() - 1
+            st.session_state.opt_metrics = cached_stage(
+                'metrics', (data_key, opt_weights, st.session_state.rf),
+                portfolio_metrics, st.session_state.opt_port_df, st.session_state.rf
             )
 
     # Отображение результатов оптимизации
@@ -120,9 +153,12 @@ def main():
         for t, w in zip(st.session_state.tickers, st.session_state.opt_weights):
             st.write(f"{t}: {w:.2%}")
 
-        plot_portfolio_return(st.session_state.opt_port_df, key_suffix="opt")
+        plot_portfolio_return(st.session_state.opt_port_df, key_suffix="opt",
+                              cache_key=(data_key, st.session_state.opt_weights))
         display_metrics(st.session_state.opt_metrics)
 
-# Точка входа
+# Точка входа: время всего прогона скрипта попадает в этап app.rerun
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with instrumentation.stage('app.rerun'):
+        main()
+    display_profiling_panel()
\ No newline at end of file
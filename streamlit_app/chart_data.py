@@ -0,0 +1,126 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from pipeline_cache import ComputationCache, make_key
+
+# Число точек на одну линию графика: около двух точек на пиксель ширины
+PIXEL_BUDGET = 2000
+
+# С какой длины исходного ряда линия рисуется через WebGL (go.Scattergl)
+WEBGL_THRESHOLD = 5000
+
+METHODS = ('lttb', 'minmax')
+
+# Кэш уменьшенных рядов и гистограмм; ключ — хэш содержимого ряда и параметры,
+# поэтому повторный запуск скрипта с теми же данными не пересчитывает прореживание
+chart_cache = ComputationCache(max_entries=128, max_bytes=64 * 1024 ** 2)
+
+
+def _x_values(index):
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(float)
+    return np.asarray(index, dtype=float)
+
+
+# Хэш значений, индекса и имени ряда
+def content_hash(series):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(_x_values(series.index)).tobytes())
+    h.update(np.ascontiguousarray(series.to_numpy(dtype=float)).tobytes())
+    h.update(str(series.name).encode('utf-8'))
+    return h.hexdigest()
+
+
+# Largest-Triangle-Three-Buckets: индексы n_out точек, сохраняющих форму линии.
+# Первая и последняя точки остаются; из каждой корзины берётся точка с наибольшей
+# площадью треугольника с предыдущей выбранной точкой и средним следующей корзины.
+def lttb(x, y, n_out):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    sums_x = np.add.reduceat(x, edges[:-1])
+    sums_y = np.add.reduceat(y, edges[:-1])
+    # reduceat у последней корзины суммирует до конца массива: убираем последнюю точку
+    sums_x[-1] -= x[-1]
+    sums_y[-1] -= y[-1]
+    avg_x = np.append(sums_x / sizes, x[-1])
+    avg_y = np.append(sums_y / sizes, y[-1])
+
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+# Min/max-прореживание: в каждой из n_out/2 корзин остаются минимум и максимум,
+# поэтому выбросы (например, нарушения VaR) не теряются
+def minmax_indices(y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    size = -(-n // (n_out // 2))
+    n_buckets = -(-n // size)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+    idx = np.concatenate([offsets + np.nanargmin(blocks, axis=1), offsets + np.nanargmax(blocks, axis=1), [0, n - 1]])
+    return np.unique(idx)
+
+
+def _decimate(series, n_out, method):
+    series = series.dropna()
+    if len(series) <= n_out:
+        return series
+    y = series.to_numpy(dtype=float)
+    if method == 'lttb':
+        idx = lttb(_x_values(series.index), y, n_out)
+    else:
+        idx = minmax_indices(y, n_out)
+    return series.iloc[idx]
+
+
+# Ряд для графика не длиннее n_out точек (пропуски NaN у длинных рядов отбрасываются)
+def reduce_series(series, n_out=PIXEL_BUDGET, method='lttb'):
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод прореживания: {method}")
+    if len(series) <= n_out:
+        return series
+    key = make_key('decimate', content_hash(series), n_out, method)
+    return chart_cache.get_or_compute(key, lambda: _decimate(series, n_out, method), name='chart.decimate')
+
+
+# Гистограмма на сервере: центры интервалов, ширина интервалов и частоты
+def histogram_bins(values, bins=50):
+    values = np.asarray(values, dtype=float)
+    counts, edges = np.histogram(values[np.isfinite(values)], bins=bins)
+    return (edges[:-1] + edges[1:]) / 2, np.diff(edges), counts
+
+
+def reduce_histogram(series, bins=50):
+    key = make_key('histogram', content_hash(series), bins)
+    return chart_cache.get_or_compute(key, lambda: histogram_bins(series.to_numpy(), bins), name='chart.histogram')
+
+
+# Линия графика по уже прореженному ряду; n_source — длина исходного ряда:
+# Scattergl для длинных рядов, иначе Scatter
+def reduced_trace(reduced, name, n_source, **kwargs):
+    trace = go.Scattergl if n_source > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=reduced.index, y=reduced.to_numpy(), mode='lines', name=name, **kwargs)
+
+
+# Линия графика по прореженному ряду
+def line_trace(series, name, n_out=PIXEL_BUDGET, method='lttb', **kwargs):
+    return reduced_trace(reduce_series(series, n_out, method), name, len(series), **kwargs)
@@ -0,0 +1,162 @@
+import datetime as dt
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from profiling import instrumentation
+
+# Параметры общего кэша: число записей, время жизни (с) и ограничение по памяти (байт)
+MAX_ENTRIES = 256
+TTL_SECONDS = 15 * 60
+MAX_BYTES = 512 * 1024 ** 2
+
+
+# Приводит аргументы ключа к стабильному представлению (тикеры, даты, веса, параметры)
+def _normalize(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return tuple(_normalize(v) for v in value.tolist())
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), 10)
+    if isinstance(value, (dt.date, dt.datetime, pd.Timestamp)):
+        return value.isoformat()
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def make_key(*parts):
+    return hashlib.sha1(repr(_normalize(parts)).encode('utf-8')).hexdigest()
+
+
+# Приблизительный размер результата в памяти
+def estimate_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value) + sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(v) for v in value.values()) + sys.getsizeof(value)
+    if hasattr(value, '__dict__'):
+        return sum(estimate_size(v) for v in vars(value).values())
+    return sys.getsizeof(value)
+
+
+# Кэш результатов этапов анализа с вытеснением LRU, временем жизни и лимитом памяти.
+# Один экземпляр на процесс сервера, поэтому им пользуются все сессии Streamlit.
+# Результаты отдаются без копирования и не должны изменяться вызывающим кодом.
+class ComputationCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, size, created = entry
+            if self.ttl is not None and time.monotonic() - created > self.ttl:
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    # Возвращает результат из кэша или вычисляет его. Параллельные запросы с одним
+    # ключом (разные сессии) ждут друг друга, и вычисление выполняется один раз.
+    # cache_if — проверка результата перед сохранением (неудачный результат не запоминается)
+    def get_or_compute(self, key, compute, name='pipeline', cache_if=None):
+        found, value = self._get(key)
+        if found:
+            with self._lock:
+                self.hits += 1
+            instrumentation.record_cache(name, True)
+            return value
+
+        # Блокировка ключа живёт, пока её ждёт или держит хотя бы один поток: [lock, число потоков].
+        # Иначе после ошибки вычисления новый вызов создал бы вторую блокировку для того же ключа
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                found, value = self._get(key)
+                if found:
+                    with self._lock:
+                        self.hits += 1
+                    instrumentation.record_cache(name, True)
+                    return value
+                with self._lock:
+                    self.misses += 1
+                instrumentation.record_cache(name, False)
+                with instrumentation.stage(name):
+                    value = compute()
+                if cache_if is None or cache_if(value):
+                    self._put(key, value)
+                return value
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+pipeline_cache = ComputationCache()
+
+
+# Вызов этапа конвейера через общий кэш; key — значения, от которых зависит результат
+def cached_stage(stage, key, func, *args, cache_if=None, **kwargs):
+    return pipeline_cache.get_or_compute(
+        make_key(stage, key), lambda: func(*args, **kwargs), name=f'pipeline.{stage}', cache_if=cache_if
+    )
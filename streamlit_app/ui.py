@@ -1,33 +1,31 @@
 import streamlit as st
 import plotly.graph_objects as go
-import plotly.express as px
 import plotly.figure_factory as ff
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 
+from loaders.universe import get_ticker_options
+from portfolio.correlation import correlation_matrix, reorder_by_clusters
+from portfolio.risk_return import calc_batch_metrics
+from profiling import instrumentation
+from chart_data import reduce_histogram, reduce_series, reduced_trace
+from pipeline_cache import cached_stage
+
 # --- UI: выбор тикеров и дат анализа ---
+# Список тикеров — все торгуемые акции MOEX (loaders.universe, кэш на сутки)
 def get_user_inputs():
     from datetime import date, timedelta
 
-    TICKER_OPTIONS = [
-        'SBER', 'GAZP', 'LKOH', 'TATN', 'ROSN', 'VTBR', 'NVTK', 'GMKN', 'CHMF',
-        'NLMK', 'PLZL', 'PHOR', 'MGNT', 'MTSS', 'MOEX', 'HYDR', 'FEES', 'IRAO', 'AFLT',
-        'ALRS', 'AFKS', 'MVID', 'PIKK', 'OZON', 'FIXP', 'SGZH', 'SNGS', 'SNGSP', 'TATNP',
-        'SBERP', 'TRNFP', 'RUAL', 'AKRN', 'MAGN', 'RTKM', 'RTKMP', 'POLY', 'TRMK', 'UPRO',
-        'URKA', 'UWGN', 'ENPG', 'SVCB', 'LSNGP', 'LSNG', 'RASP', 'MSNG', 'NMTP', 'CBOM',
-        'DSKY', 'LNTA', 'MFON', 'AGRO', 'BANE', 'BANEP', 'DIXY', 'EONR', 'LSRG', 'MRKH',
-        'MSRS', 'MSTT', 'MTLR', 'MTLRP', 'OGKB', 'PHST', 'RSTI', 'SVAV', 'VSMO', 'VZRZ', 'YDEX'
-    ]
+    ticker_options, names = get_ticker_options()
 
     # Оставляем только те тикеры, которые точно есть в списке
-    default_selection = [t for t in ['SBER', 'GAZP'] if t in TICKER_OPTIONS]
+    default_selection = [t for t in ['SBER', 'GAZP'] if t in ticker_options]
 
-    tickers = st.multiselect("Выберите тикеры", TICKER_OPTIONS, default=default_selection)
-    start = st.date_input("Дата начала", date.today() - timedelta(days=365))
-    end = st.date_input("Дата конца", date.today())
-    return tickers, start, end
-
-    tickers = st.multiselect("Выберите тикеры", TICKER_OPTIONS, default=['SBER', 'GAZP'])
+    tickers = st.multiselect(
+        "Выберите тикеры", ticker_options, default=default_selection,
+        format_func=lambda t: f"{t} — {names[t]}" if names.get(t) else t
+    )
     start = st.date_input("Дата начала", date.today() - timedelta(days=365))
     end = st.date_input("Дата конца", date.today())
     return tickers, start, end
@@ -43,13 +41,31 @@ def get_weights_ui(tickers, saved_weights=None):
             weights.append(w)
     return weights
 
+# Вызов этапа через общий кэш, если известен ключ данных (тикеры, даты, веса);
+# без ключа — прямой вызов
+def _cached(stage, cache_key, func, *args):
+    if cache_key is None:
+        return func(*args)
+    return cached_stage(stage, cache_key, func, *args)
+
+# Прореженные ряды доходности и 20-дневного скользящего среднего и длина исходного ряда
+def portfolio_return_series(df):
+    returns = df['Portfolio_Return']
+    rolling = returns.rolling(20).mean()
+    return reduce_series(returns, method='minmax'), reduce_series(rolling), len(returns)
+
 # --- Визуализация доходности портфеля с 20-дневным скользящим ---
-def plot_portfolio_return(df, key_suffix="fact"):
-    rolling = df['Portfolio_Return'].rolling(20).mean()
+# Длинные ряды прореживаются до бюджета точек (chart_data): доходность — min/max,
+# чтобы не терять выбросы, скользящее среднее — LTTB.
+# cache_key — ключ данных портфеля: при повторном запуске скрипта ряды берутся
+# из общего кэша без пересчёта скользящего среднего и хэшей содержимого
+@instrumentation.timed('ui.plot_portfolio_return')
+def plot_portfolio_return(df, key_suffix="fact", cache_key=None):
+    returns, rolling, n_source = _cached('return_chart', cache_key, portfolio_return_series, df)
 
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=df.index, y=df['Portfolio_Return'], mode='lines', name='Доходность', line=dict(color='green')))
-    fig.add_trace(go.Scatter(x=df.index, y=rolling, mode='lines', name='20-дн. скользящее', line=dict(dash='dash', color='gray')))
+    fig.add_trace(reduced_trace(returns, 'Доходность', n_source, line=dict(color='green')))
+    fig.add_trace(reduced_trace(rolling, '20-дн. скользящее', n_source, line=dict(dash='dash', color='gray')))
 
     fig.update_layout(
         title="Интерактивная доходность портфеля",
@@ -58,13 +74,16 @@ def plot_portfolio_return(df, key_suffix="fact"):
     )
     st.plotly_chart(fig, use_container_width=True, key=f"portfolio_return_{key_suffix}")
 
-# --- Гистограмма доходности портфеля ---
-def plot_return_distribution(df, key):
+# --- Гистограмма доходности портфеля (интервалы считаются на сервере) ---
+@instrumentation.timed('ui.plot_return_distribution')
+def plot_return_distribution(df, key, cache_key=None):
     st.subheader("Распределение дневной доходности")
-    fig = px.histogram(df, x='Portfolio_Return', nbins=50,
-                       title="Гистограмма доходности портфеля",
-                       labels={'Portfolio_Return': 'Доходность'}, template="plotly_white")
-    fig.update_layout(bargap=0.1)
+    centers, widths, counts = _cached('return_histogram', cache_key, reduce_histogram, df['Portfolio_Return'])
+    fig = go.Figure(go.Bar(x=centers, y=counts, width=widths * 0.9, name='Доходность'))
+    fig.update_layout(
+        title="Гистограмма доходности портфеля",
+        xaxis_title="Доходность", yaxis_title="Количество дней", template="plotly_white"
+    )
     st.plotly_chart(fig, use_container_width=True, key=key)
 
 # --- Метрики портфеля: доходность, риск, Шарп, кумулятив ---
@@ -75,50 +94,79 @@ def display_metrics(metrics):
     col3.metric("Коэффициент Шарпа", f"{metrics['sharpe_ratio']:.2f}")
     col4.metric("Доходность за период", f"{metrics['cumulative_return']:.2%}")
 
+# Метрики активов одним пакетом: каждый актив — «портфель» из одного актива
+def asset_metrics(df, tickers, risk_free_rate):
+    returns = df[[f"{t}_Daily_Return" for t in tickers]].to_numpy()
+    return calc_batch_metrics(returns, np.eye(len(tickers)), risk_free_rate)
+
 # --- Статистика по каждому активу в портфеле ---
-def display_asset_statistics(df, tickers, risk_free_rate=0.0):
+def display_asset_statistics(df, tickers, risk_free_rate=0.0, cache_key=None):
     st.subheader("Статистика по каждому активу")
-    for ticker in tickers:
-        price_col = f"{ticker}_Stock_Price"
-        return_col = f"{ticker}_Daily_Return"
-        if price_col in df.columns and return_col in df.columns:
-            avg_return = df[return_col].mean()
-            std_dev = df[return_col].std()
-            annualized_return = avg_return * 252
-            annualized_std = std_dev * np.sqrt(252)
-            sharpe = (annualized_return - risk_free_rate) / annualized_std if annualized_std != 0 else 0
-            cumulative = (1 + df[return_col]).prod() - 1
-
-            with st.expander(f"{ticker} - Метрики"):
-                col1, col2, col3, col4 = st.columns(4)
-                col1.metric("Средняя доходность", f"{avg_return:.4%}")
-                col2.metric("Станд. отклонение", f"{std_dev:.4%}")
-                col3.metric("Шарп", f"{sharpe:.2f}")
-                col4.metric("Доходность за период", f"{cumulative:.2%}")
+    present = [t for t in tickers if f"{t}_Stock_Price" in df.columns and f"{t}_Daily_Return" in df.columns]
+    if not present:
+        return
+
+    stats = _cached('asset_stats', (cache_key, risk_free_rate) if cache_key is not None else None,
+                    asset_metrics, df, present, risk_free_rate)
+
+    for ticker, row in zip(present, stats.itertuples(index=False)):
+        with st.expander(f"{ticker} - Метрики"):
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Средняя доходность", f"{row.avg_daily_return:.4%}")
+            col2.metric("Станд. отклонение", f"{row.std_dev:.4%}")
+            col3.metric("Шарп", f"{row.sharpe_ratio:.2f}")
+            col4.metric("Доходность за период", f"{row.cumulative_return:.2%}")
+
+# Больше этого числа активов тепловая карта строится без подписей в ячейках,
+# а активы упорядочиваются по кластерам корреляций
+HEATMAP_ANNOTATION_LIMIT = 20
+
+# --- Данные для корреляционной матрицы: значения, подписи осей и аннотации ---
+# Корреляции считаются по парно полным наблюдениям (portfolio.correlation).
+# Возвращает None, если активов меньше двух или доходности постоянны;
+# аннотации — None для матриц больше HEATMAP_ANNOTATION_LIMIT
+def prepare_heatmap_data(df):
+    returns_df = df.filter(like="_Daily_Return")
+    returns_df.columns = [c.removesuffix("_Daily_Return") for c in returns_df.columns]
+
+    if returns_df.shape[1] < 2 or returns_df.var().sum() == 0:
+        return None
+
+    corr_matrix = correlation_matrix(returns_df)
+    annotate = len(corr_matrix) <= HEATMAP_ANNOTATION_LIMIT
+    if not annotate:
+        corr_matrix = reorder_by_clusters(corr_matrix)
+
+    tickers_order = list(corr_matrix.columns)
+    z_values = np.round(corr_matrix.to_numpy(), 3)[::-1]
+    annotation_text = [[f"{val:.3f}" for val in row] for row in z_values.tolist()] if annotate else None
+
+    return z_values, tickers_order, tickers_order[::-1], annotation_text
 
 # --- Корреляционная матрица доходностей ---
-def plot_correlation_heatmap(df):
+@instrumentation.timed('ui.plot_correlation_heatmap')
+def plot_correlation_heatmap(df, cache_key=None):
     st.subheader("Корреляционная матрица доходностей")
-    returns_df = df.filter(like="_Daily_Return").dropna(how="any")
+    heatmap = _cached('heatmap', cache_key, prepare_heatmap_data, df)
 
-    if returns_df.shape[1] < 2 or returns_df.var().sum() == 0:
+    if heatmap is None:
         st.warning("Недостаточно данных для построения корреляционной матрицы.")
         return
 
-    tickers_order = list(returns_df.columns)
-    corr_matrix = returns_df[tickers_order].corr().loc[tickers_order, tickers_order]
-    z_values = np.round(corr_matrix.values, 3).tolist()
-    annotation_text = [[f"{val:.3f}" for val in row] for row in z_values]
-
-    z_values = z_values[::-1]
-    annotation_text = annotation_text[::-1]
-    y_labels = tickers_order[::-1]
-
-    fig = ff.create_annotated_heatmap(
-        z=z_values, x=tickers_order, y=y_labels,
-        annotation_text=annotation_text, colorscale="Viridis", showscale=True
-    )
-    fig.update_layout(height=600, margin=dict(l=20, r=20, t=20, b=20), font=dict(size=14))
+    z_values, tickers_order, y_labels, annotation_text = heatmap
+    if annotation_text is not None:
+        fig = ff.create_annotated_heatmap(
+            z=z_values.tolist(), x=tickers_order, y=y_labels,
+            annotation_text=annotation_text, colorscale="Viridis", showscale=True
+        )
+        fig.update_layout(height=600, margin=dict(l=20, r=20, t=20, b=20), font=dict(size=14))
+    else:
+        # Большая матрица: один трейс Heatmap без подписей ячеек
+        fig = go.Figure(go.Heatmap(
+            z=z_values, x=tickers_order, y=y_labels, colorscale="Viridis", zmin=-1, zmax=1
+        ))
+        fig.update_layout(height=max(600, 12 * len(tickers_order)),
+                          margin=dict(l=20, r=20, t=20, b=20), font=dict(size=10))
     st.plotly_chart(fig, use_container_width=True, key="correlation_matrix")
 
 # --- Визуализация функции волатильности в процессе оптимизации ---
@@ -154,14 +202,21 @@ def display_var_results(stock_data, results, ma_window):
     st.write(f"• Нарушений: {results['Violations, Historical VaR']}")
     st.write(f"• p-значение: {results['p-value, Historical VaR']:.4f}")
 
+# Прореженные ряды доходности и VaR для графика и длина исходного ряда
+def var_chart_series(port_df):
+    return (reduce_series(port_df['Portfolio_Return'], method='minmax'), reduce_series(port_df['Var Historical']),
+            reduce_series(port_df['Delta-Normal VaR']), len(port_df))
+
 # --- График VaR анализа портфеля ---
-def plot_var_analysis(port_df, ma_window):
+@instrumentation.timed('ui.plot_var_analysis')
+def plot_var_analysis(port_df, ma_window, cache_key=None):
     st.subheader("Анализ VaR портфеля")
 
+    returns, historical, delta_normal, n_source = _cached('var_chart', cache_key, var_chart_series, port_df)
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=port_df.index, y=port_df['Portfolio_Return'], mode='lines', name='Доходность'))
-    fig.add_trace(go.Scatter(x=port_df.index, y=port_df['Var Historical'], mode='lines', name='Historical VaR'))
-    fig.add_trace(go.Scatter(x=port_df.index, y=port_df['Delta-Normal VaR'], mode='lines', name='Delta-Normal VaR'))
+    fig.add_trace(reduced_trace(returns, 'Доходность', n_source))
+    fig.add_trace(reduced_trace(historical, 'Historical VaR', n_source))
+    fig.add_trace(reduced_trace(delta_normal, 'Delta-Normal VaR', n_source))
 
     fig.update_layout(
         title="Сравнение VaR",
@@ -169,4 +224,27 @@ def plot_var_analysis(port_df, ma_window):
         yaxis_title="Значение",
         template='plotly_white'
     )
-    st.plotly_chart(fig, use_container_width=True, key="var_comparison")
\ No newline at end of file
+    st.plotly_chart(fig, use_container_width=True, key="var_comparison")
+
+# --- Панель профилирования (включается переменной окружения PORTFOLIO_PROFILE=1) ---
+def display_profiling_panel():
+    if not instrumentation.is_enabled():
+        return
+
+    data = instrumentation.snapshot()
+    sections = (
+        ("Этапы (время, с)", 'stages'), ("HTTP-запросы", 'http'),
+        ("Кэши", 'caches'), ("Размеры DataFrame", 'frames'),
+    )
+    with st.sidebar.expander("Профилирование", expanded=False):
+        for title, section in sections:
+            if data[section]:
+                st.caption(title)
+                st.dataframe(pd.DataFrame.from_dict(data[section], orient='index'))
+
+        st.download_button("Скачать JSON", instrumentation.to_json(),
+                           file_name="profile.json", mime="application/json")
+        st.download_button("Скачать Prometheus", instrumentation.to_prometheus(),
+                           file_name="profile.prom", mime="text/plain")
+        if st.button("Сбросить статистику", key="profiling_reset"):
+            instrumentation.reset()
@@ -0,0 +1,27 @@
+# Общая настройка тестов: загрузчики работают с локальной заглушкой ISS
+# (benchmarks.synthetic.StubISSServer) и временным кэшем котировок, сеть не используется.
+# Окружение задаётся до импорта модулей loaders, так как они читают его при импорте.
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import StubISSServer
+
+_server = StubISSServer().start()
+_cache_dir = tempfile.mkdtemp(prefix='portfolio_app_tests_')
+os.environ['MOEX_ISS_URL'] = _server.url
+os.environ['MOEX_CACHE_PATH'] = os.path.join(_cache_dir, 'prices.sqlite')
+os.environ['MOEX_ISS_RATE'] = '0'
+
+
+@pytest.fixture
+def iss_server():
+    _server.latency = 0.0
+    _server.httpd.history_limit = None
+    yield _server
+    _server.httpd.history_limit = None
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portfolio.monte_carlo import _tail_stats, simulate_portfolio_var
+
+TICKERS = ['A', 'B', 'C']
+CONFIDENCE_LEVELS = (0.95, 0.99, 0.999)
+
+
+@pytest.fixture(scope='module')
+def port_df():
+    rng = np.random.default_rng(1)
+    return pd.DataFrame(rng.normal(0, 0.01, (60, 3)), columns=[f"{t}_Daily_Return" for t in TICKERS])
+
+
+# VaR/ES по объединённым хвостам блоков совпадают с расчётом по всем путям сразу;
+# bootstrap по 60 дням даёт много повторяющихся доходностей на границе хвоста
+@pytest.mark.parametrize('method', ['normal', 't', 'bootstrap'])
+@pytest.mark.parametrize('chunk_size', [997, 20_000])
+def test_merged_tails_match_full_sample(port_df, method, chunk_size):
+    result = simulate_portfolio_var(port_df, TICKERS, [[0.2, 0.3, 0.5], [1.0, 0.0, 0.0]], n_paths=20_000,
+                                    method=method, confidence_levels=CONFIDENCE_LEVELS, chunk_size=chunk_size,
+                                    n_workers=1, seed=3, return_paths=True)
+    var, es = _tail_stats(result['Portfolio Returns'], 1 - np.asarray(CONFIDENCE_LEVELS))
+    np.testing.assert_allclose(result['VaR'], var, rtol=1e-12)
+    np.testing.assert_allclose(result['ES'], es, rtol=1e-12)
+    assert result['Chunk VaR'].shape == (-(-20_000 // chunk_size), len(CONFIDENCE_LEVELS), 2)
+
+
+def test_paths_are_returned_only_on_request(port_df):
+    result = simulate_portfolio_var(port_df, TICKERS, [0.2, 0.3, 0.5], n_paths=1_000, n_workers=1, seed=0)
+    assert 'Portfolio Returns' not in result
+    assert result['VaR'].shape == (2, 1)
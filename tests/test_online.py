@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from loaders.marketdata import replay_marketdata
+from portfolio.online import OnlineRiskEngine, PortfolioMonitor, monitor_portfolios
+from portfolio.var_analysis import perform_var_analysis
+from portfolio.var_backtest import coverage_tests
+
+# Запись poll_marketdata(record_path=...): 90 торговых дней по три снимка, в части
+# дневных снимков нет цены GAZP
+REPLAY_PATH = os.path.join(os.path.dirname(__file__), 'data', 'marketdata_replay.jsonl')
+TICKERS = ['SBER', 'GAZP']
+WEIGHTS = [0.6, 0.4]
+PREV_CLOSE = {'SBER': 300.0, 'GAZP': 160.0}
+MA_WINDOW = 20
+
+
+# Дневные доходности портфеля по последним ценам каждого дня записи (пакетный расчёт);
+# бумага без цены в снимке сохраняет предыдущую цену, как в PortfolioMonitor
+def daily_returns(snapshots):
+    prices = dict(PREV_CLOSE)
+    closes = {}
+    for snapshot in snapshots:
+        prices.update(snapshot['prices'])
+        closes[snapshot['date']] = dict(prices)
+    frame = pd.DataFrame([PREV_CLOSE, *closes.values()])[TICKERS]
+    returns = frame.pct_change().iloc[1:].to_numpy() @ np.array(WEIGHTS)
+    return pd.Series(returns, index=pd.to_datetime(list(closes)))
+
+
+@pytest.fixture(scope='module')
+def replay():
+    snapshots = list(replay_marketdata(REPLAY_PATH))
+    monitor = PortfolioMonitor('test', TICKERS, WEIGHTS, PREV_CLOSE, engine=OnlineRiskEngine(ma_window=MA_WINDOW))
+    statuses = [status for status, in monitor_portfolios([monitor], snapshots)]
+    return snapshots, monitor, statuses
+
+
+def test_replay_reads_recorded_snapshots(replay):
+    snapshots, _, statuses = replay
+    assert len(snapshots) == len(statuses) == 270
+    assert len({s['date'] for s in snapshots}) == 90
+
+
+# Последний день записи ещё не закрыт: в движке все дни, кроме него
+def test_online_results_match_batch(replay):
+    snapshots, monitor, _ = replay
+    returns = daily_returns(snapshots)
+    assert monitor.intraday_return == pytest.approx(returns.iloc[-1], abs=1e-12)
+
+    df, results, _ = perform_var_analysis(returns.iloc[:-1].to_frame('Portfolio_Return'), ma_window=MA_WINDOW)
+    online = monitor.engine.results()
+    for key in ('Violations, Delta-Normal VaR', 'Violations, Historical VaR', 'Observations'):
+        assert online[key] == results[key]
+    for key in ('p-value, Delta-Normal VaR', 'p-value, Historical VaR', 'Expected Violations (5%)'):
+        assert online[key] == pytest.approx(results[key], rel=1e-12)
+    assert results['Violations, Delta-Normal VaR'] > 0
+
+    last = monitor.engine.last
+    for key in ('Delta-Normal VaR', 'Var Historical', 'MA', 'EWMA', 'EWMA Variance'):
+        assert last[key] == pytest.approx(df[key].iloc[-1], rel=1e-9)
+
+
+# Прогноз VaR в первом снимке дня построен по окну до предыдущего дня включительно —
+# это пакетный VaR со сдвигом на день; тесты Купика и Кристофферсена по нарушениям
+# на закрытии дня совпадают
+def test_intraday_forecasts_and_coverage_tests_match_batch(replay):
+    snapshots, _, statuses = replay
+    returns = daily_returns(snapshots)
+    df, _, _ = perform_var_analysis(returns.to_frame('Portfolio_Return'), ma_window=MA_WINDOW)
+
+    first_of_day = {}
+    for snapshot, status in zip(snapshots, statuses):
+        first_of_day.setdefault(snapshot['date'], status)
+    online = pd.DataFrame(list(first_of_day.values()), index=returns.index)
+
+    realized = returns.to_numpy()
+    alpha = 0.05
+    for model in ('Delta-Normal VaR', 'Var Historical'):
+        batch = df[model].shift(1).to_numpy()
+        np.testing.assert_allclose(online[model].to_numpy(dtype=float), batch, rtol=1e-9, equal_nan=True)
+
+        valid = ~np.isnan(batch)
+        expected = coverage_tests(realized < batch, valid, alpha)
+        actual = coverage_tests(realized < online[model].to_numpy(dtype=float), valid, alpha)
+        assert actual['Violations'] == expected['Violations']
+        for key in ('p-value POF', 'p-value Independence', 'p-value Conditional Coverage'):
+            assert actual[key] == pytest.approx(expected[key], rel=1e-12)
+
+    # Флаг нарушения внутри дня — сравнение текущей доходности с прогнозом
+    breaches = [s['Breach, Historical VaR'] == (s['Intraday Return'] < s['Var Historical']) for s in statuses]
+    assert all(breaches)
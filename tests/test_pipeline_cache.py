@@ -0,0 +1,105 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Модули интерфейса импортируются так же, как при запуске streamlit run streamlit_app/app.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'streamlit_app'))
+from pipeline_cache import ComputationCache
+
+
+def run_threads(n, target):
+    threads = [threading.Thread(target=target) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_concurrent_requests_compute_once():
+    cache = ComputationCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return 42
+
+    results = []
+    run_threads(8, lambda: results.append(cache.get_or_compute('k', compute)))
+    assert results == [42] * 8
+    assert len(calls) == 1
+    assert cache._key_locks == {}
+
+
+# Первое вычисление падает, пока другие потоки ждут ключ: повторные вычисления идут
+# по очереди под той же блокировкой, одновременно их не бывает ни в какой момент
+def test_failed_compute_keeps_single_flight():
+    cache = ComputationCache()
+    state = {'active': 0, 'max_active': 0, 'calls': 0}
+    lock = threading.Lock()
+
+    def compute():
+        with lock:
+            state['calls'] += 1
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+            first = state['calls'] == 1
+        time.sleep(0.05)
+        with lock:
+            state['active'] -= 1
+        if first:
+            raise RuntimeError("сбой")
+        return 'ok'
+
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(cache.get_or_compute('k', compute))
+        except RuntimeError as e:
+            errors.append(e)
+
+    # Первый поток падает через 50 мс; ожидающие стартуют до этого, поздние — после,
+    # пока один из ожидающих пересчитывает
+    first = threading.Thread(target=call)
+    first.start()
+    time.sleep(0.01)
+    waiting = [threading.Thread(target=call) for _ in range(3)]
+    for t in waiting:
+        t.start()
+    time.sleep(0.06)
+    run_threads(3, call)
+    for t in [first, *waiting]:
+        t.join()
+
+    assert state['max_active'] == 1
+    assert len(errors) == 1
+    assert results == ['ok'] * 6
+    assert state['calls'] == 2
+    assert cache._key_locks == {}
+
+
+def test_lock_is_released_after_error():
+    cache = ComputationCache()
+    with pytest.raises(ValueError):
+        cache.get_or_compute('k', lambda: (_ for _ in ()).throw(ValueError("сбой")))
+    assert cache._key_locks == {}
+    assert cache.get_or_compute('k', lambda: 1) == 1
+
+
+# Результат, не прошедший cache_if (например, загрузка с пустыми рядами), не запоминается
+def test_rejected_result_is_not_cached():
+    cache = ComputationCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [] if len(calls) == 1 else [1]
+
+    for _ in range(3):
+        cache.get_or_compute('k', compute, cache_if=bool)
+    assert len(calls) == 2
+    assert cache.stats()['entries'] == 1
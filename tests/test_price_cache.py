@@ -0,0 +1,161 @@
+import datetime as dt
+
+import pytest
+
+from loaders import moex_loader
+from loaders.moex_loader import get_moex_data_and_prepare, iter_chunks, update_price_cache
+from loaders.price_cache import PriceCache, cache_stats, invalidate_cache
+
+TODAY = dt.date.today()
+YESTERDAY = TODAY - dt.timedelta(days=1)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PriceCache(str(tmp_path / 'prices.sqlite'))
+
+
+# Число запросов к заглушке ISS во время вызова func
+def count_requests(server, func):
+    before = server.requests
+    func()
+    return server.requests - before
+
+
+def test_only_missing_ranges_are_fetched(iss_server, cache):
+    first = (dt.date(2020, 1, 1), dt.date(2020, 6, 30))
+    update_price_cache('T001', *first, cache=cache)
+
+    wider = (dt.date(2019, 7, 1), dt.date(2020, 12, 31))
+    gaps = cache.missing_ranges('T001', *wider)
+    assert gaps == [(dt.date(2019, 7, 1), dt.date(2019, 12, 31)), (dt.date(2020, 7, 1), dt.date(2020, 12, 31))]
+
+    # Страница заглушки — 100 строк, отрезок 100 дней укладывается в одну страницу
+    expected = sum(len(list(iter_chunks(a, b))) for a, b in gaps)
+    assert count_requests(iss_server, lambda: update_price_cache('T001', *wider, cache=cache)) == expected
+    assert cache.covered_ranges('T001') == [wider]
+
+
+def test_closed_past_days_are_not_refetched(iss_server, cache):
+    window = (dt.date(2021, 1, 1), dt.date(2021, 12, 31))
+    assert count_requests(iss_server, lambda: update_price_cache('T002', *window, cache=cache)) > 0
+    assert count_requests(iss_server, lambda: update_price_cache('T002', *window, cache=cache)) == 0
+    assert count_requests(iss_server, lambda: update_price_cache('T002', dt.date(2021, 3, 1), dt.date(2021, 9, 30),
+                                                                 cache=cache)) == 0
+    assert len(cache.load('T002', *window)) > 200
+
+
+def test_today_is_always_refetched(iss_server, cache):
+    window = (TODAY - dt.timedelta(days=30), TODAY)
+    update_price_cache('T003', *window, cache=cache)
+
+    assert cache.missing_ranges('T003', *window) == [(TODAY, TODAY)]
+    assert cache.covered_ranges('T003')[-1][1] == YESTERDAY
+    assert count_requests(iss_server, lambda: update_price_cache('T003', *window, cache=cache)) == 1
+    assert count_requests(iss_server, lambda: update_price_cache('T003', *window, cache=cache)) == 1
+
+
+# Обрыв выдачи ISS (пустая страница раньше TOTAL курсора): строки сохраняются,
+# но диапазон не считается загруженным и запрашивается снова
+def test_incomplete_response_is_not_marked_covered(iss_server, cache):
+    window = (dt.date(2022, 1, 1), dt.date(2022, 3, 31))
+    iss_server.httpd.history_limit = 10
+    update_price_cache('T004', *window, cache=cache)
+
+    assert len(cache.load('T004', *window)) == 10
+    assert cache.missing_ranges('T004', *window) == [window]
+
+    iss_server.httpd.history_limit = None
+    assert count_requests(iss_server, lambda: update_price_cache('T004', *window, cache=cache)) > 0
+    assert cache.missing_ranges('T004', *window) == []
+    assert len(cache.load('T004', *window)) > 10
+
+
+def test_cache_stats_and_invalidate(iss_server):
+    invalidate_cache()
+    window = (dt.date(2023, 1, 1), dt.date(2023, 6, 30))
+
+    get_moex_data_and_prepare('T005', *window)
+    get_moex_data_and_prepare('T006', *window)
+    stats = cache_stats()
+    assert stats['securities'] == 2
+    assert stats['covered_ranges'] == 2
+    assert stats['rows'] > 0
+    assert stats['size_bytes'] > 0
+    misses = stats['misses']
+
+    get_moex_data_and_prepare('T005', *window)
+    stats = cache_stats()
+    assert stats['misses'] == misses
+    assert stats['hits'] >= 1
+
+    n_rows = stats['rows']
+    removed = invalidate_cache('T005')
+    assert 0 < removed < n_rows
+    assert cache_stats()['securities'] == 1
+    assert count_requests(iss_server, lambda: get_moex_data_and_prepare('T005', *window)) > 0
+
+    assert invalidate_cache() > 0
+    assert cache_stats()['rows'] == 0
+    assert cache_stats()['covered_ranges'] == 0
+
+
+# Ошибка одного куска тикера: ряд с дырой не возвращается, тикер остаётся без данных
+@pytest.mark.parametrize('use_cache', [True, False])
+def test_failed_chunk_drops_ticker(iss_server, monkeypatch, use_cache):
+    window = (dt.date(2018, 1, 1), dt.date(2018, 12, 31))
+    failing = list(iter_chunks(*window))[1]
+    fetch = moex_loader.fetch_history_window
+
+    def flaky_fetch(secid, start_date, end_date, *args, **kwargs):
+        if secid == 'T007' and (start_date, end_date) == failing:
+            raise ConnectionError('обрыв соединения')
+        return fetch(secid, start_date, end_date, *args, **kwargs)
+
+    monkeypatch.setattr(moex_loader, 'fetch_history_window', flaky_fetch)
+    broken, whole = moex_loader.fetch_many(['T007', 'T008'], *window, use_cache=use_cache)
+    assert broken.empty
+    assert len(whole) > 200
+
+
+# Ошибка в середине окна: возвращается только непрерывное начало ряда до упавшего куска,
+# с кэшем и без него одинаково
+@pytest.mark.parametrize('use_cache', [True, False])
+def test_failed_chunk_keeps_contiguous_prefix(iss_server, monkeypatch, cache, use_cache):
+    window = (dt.date(2017, 1, 1), dt.date(2017, 12, 31))
+    failing = list(iter_chunks(*window))[2]
+    fetch = moex_loader.fetch_history_window
+
+    def flaky_fetch(secid, start_date, end_date, *args, **kwargs):
+        if (start_date, end_date) == failing:
+            raise ConnectionError('обрыв соединения')
+        return fetch(secid, start_date, end_date, *args, **kwargs)
+
+    monkeypatch.setattr(moex_loader, 'fetch_history_window', flaky_fetch)
+    with pytest.raises(ConnectionError):
+        update_price_cache('T009', *window, cache=cache)
+    assert cache.covered_until('T009', window[0]) == failing[0] - dt.timedelta(days=1)
+
+    df = get_moex_data_and_prepare('T010', *window, use_cache=use_cache)
+    assert df.index[-1].date() < failing[0]
+    assert df.index[-1].date() >= failing[0] - dt.timedelta(days=7)
+
+
+# resolve=True: бумага, которой нет в справочнике, не запрашивается по TQBR и остаётся без данных
+def test_unknown_secid_is_skipped(iss_server, monkeypatch):
+    window = (dt.date(2016, 1, 1), dt.date(2016, 6, 30))
+    resolve = moex_loader.get_securities_info
+    fetch = moex_loader.fetch_history_window
+    requested = []
+
+    def fetch_logged(secid, *args, **kwargs):
+        requested.append(secid)
+        return fetch(secid, *args, **kwargs)
+
+    monkeypatch.setattr(moex_loader, 'get_securities_info',
+                        lambda secids, **kwargs: {s: i for s, i in resolve(secids, **kwargs).items() if s != 'NOPE'})
+    monkeypatch.setattr(moex_loader, 'fetch_history_window', fetch_logged)
+    unknown, known = moex_loader.fetch_many(['NOPE', 'T011'], *window, resolve=True)
+    assert unknown.empty
+    assert len(known) > 100
+    assert set(requested) == {'T011'}
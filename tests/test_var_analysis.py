@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import reference
+from benchmarks.synthetic import correlated_returns
+from portfolio.var_analysis import perform_var_analysis
+
+
+# Векторизованный perform_var_analysis совпадает с прежним (rolling().apply)
+# на нескольких длинах окна; число нарушений — точно
+@pytest.mark.parametrize('window', [20, 50, 250])
+def test_perform_var_analysis_matches_apply_reference(window):
+    df = pd.DataFrame({'Portfolio_Return': correlated_returns(2_000, 1, seed=window)[:, 0]})
+    new_df, new_results, _ = perform_var_analysis(df, ma_window=window)
+    old_df, old_results, _ = reference.perform_var_analysis(df, ma_window=window)
+
+    np.testing.assert_allclose(new_df['Delta-Normal VaR'], old_df['Delta-Normal VaR'], rtol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(new_df['Var Historical'], old_df['Var Historical'], rtol=1e-12, equal_nan=True)
+    assert new_df['Delta-Normal VaR'].isna().sum() == window - 1
+
+    for key in ('Violations, Delta-Normal VaR', 'Violations, Historical VaR', 'Observations'):
+        assert new_results[key] == old_results[key]
+    for key in ('p-value, Delta-Normal VaR', 'p-value, Historical VaR'):
+        assert new_results[key] == pytest.approx(old_results[key], rel=1e-12)
@@ -0,0 +1,66 @@
+import math
+
+import numpy as np
+import pytest
+from scipy.stats import norm
+
+from portfolio.var_backtest import coverage_tests, var_forecasts
+
+# Нарушения группируются парами; восьмое наблюдение без прогноза (исключается
+# из подсчёта и разрывает переходы 7→8 и 8→9)
+HITS = np.array([0, 0, 1, 1, 0, 0, 0, 1, 1, 0, 1, 1], dtype=bool)
+VALID = np.array([1, 1, 1, 1, 1, 1, 1, 1, 0, 1, 1, 1], dtype=bool)
+
+
+# По 11 наблюдениям с прогнозом: 5 нарушений при alpha = 0.1.
+# Переходы (пары соседних наблюдений с прогнозом): n00 = 3, n01 = 3, n10 = 1, n11 = 2
+def test_kupiec_and_christoffersen():
+    tests = coverage_tests(HITS, VALID, 0.1)
+    assert tests['Observations'] == 11
+    assert tests['Violations'] == 5
+
+    lr_pof = -2 * (6 * math.log(0.9) + 5 * math.log(0.1) - 6 * math.log(6 / 11) - 5 * math.log(5 / 11))
+    lr_ind = -2 * (4 * math.log(4 / 9) + 5 * math.log(5 / 9)
+                   - 3 * math.log(1 / 2) - 3 * math.log(1 / 2) - math.log(1 / 3) - 2 * math.log(2 / 3))
+    assert tests['LR POF'] == pytest.approx(lr_pof, rel=1e-12)
+    assert tests['LR POF'] == pytest.approx(9.1320, abs=1e-4)
+    assert tests['LR Independence'] == pytest.approx(lr_ind, rel=1e-12)
+    assert tests['LR Independence'] == pytest.approx(0.2285, abs=1e-4)
+    assert tests['LR Conditional Coverage'] == pytest.approx(lr_pof + lr_ind, rel=1e-12)
+    assert tests['p-value Conditional Coverage'] == pytest.approx(math.exp(-(lr_pof + lr_ind) / 2), rel=1e-12)
+
+
+# Окно [-2, -1, 0, 1, 2] %: среднее 0, s = sqrt(2.5) %, асимметрия 0,
+# эксцесс (несмещённый, как pandas) = 4 / 6 * (6 * 1.7 - 12) = -1.2
+def test_cornish_fisher_var_es():
+    returns = np.array([-0.02, -0.01, 0.0, 0.01, 0.02, 0.0])
+    forecast = var_forecasts(returns, window=5, confidence_levels=(0.95,), models=('Cornish-Fisher',))
+
+    def cf(z):
+        return z + (z ** 3 - 3 * z) * -1.2 / 24
+
+    std = math.sqrt(2.5) / 100
+    es = np.mean([cf(norm.ppf(0.05 * (k + 0.5) / 16)) for k in range(16)]) * std
+    var = forecast['Cornish-Fisher']['VaR'][0, 5, 0]
+    assert var == pytest.approx(cf(norm.ppf(0.05)) * std, rel=1e-9)
+    assert var == pytest.approx(-0.0263901, rel=1e-5)
+    assert forecast['Cornish-Fisher']['ES'][0, 5, 0] == pytest.approx(es, rel=1e-9)
+    assert np.isnan(forecast['Cornish-Fisher']['VaR'][0, :5, 0]).all()
+
+
+# EWMA (lam = 0.5, веса нормируются, как pandas ewm) по квадратам доходностей
+# [1, 4, 1, 9, 4] (в 1e-4): 1, 3, 13/7, 17/3, 149/31. Стандартизованные остатки
+# дней 1..4: 2, -1/sqrt(3), 3/sqrt(13/7), -2/sqrt(17/3); прогноз на день 5 —
+# их квантиль и среднее хвоста, умноженные на sqrt(149/31) %
+def test_fhs_var_es():
+    returns = np.array([0.01, 0.02, -0.01, 0.03, -0.02, 0.01])
+    forecast = var_forecasts(returns, window=4, confidence_levels=(0.75, 0.5), lam=0.5, models=('FHS',))
+
+    z = sorted([2.0, -1 / math.sqrt(3), 3 / math.sqrt(13 / 7), -2 / math.sqrt(17 / 3)])
+    vol = math.sqrt(149 / 31) / 100
+    var_25 = (z[0] + 0.75 * (z[1] - z[0])) * vol
+    var_50 = (z[1] + 0.5 * (z[2] - z[1])) * vol
+    assert forecast['FHS']['VaR'][:, 5, 0] == pytest.approx([var_25, var_50], rel=1e-12)
+    assert forecast['FHS']['ES'][:, 5, 0] == pytest.approx([z[0] * vol, (z[0] + z[1]) / 2 * vol], rel=1e-12)
+    assert var_25 == pytest.approx(-0.0140980, rel=1e-5)
+    assert np.isnan(forecast['FHS']['VaR'][:, :5, 0]).all()
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from portfolio import walk_forward
+from portfolio.optimizer import optimize_portfolio_weights
+from portfolio.walk_forward import rebalance_positions, walk_forward_backtest
+
+TICKERS = ['A', 'B', 'C']
+WINDOW = 60
+COST = 0.001
+
+
+@pytest.fixture(scope='module')
+def port_df():
+    rng = np.random.default_rng(7)
+    index = pd.bdate_range('2021-01-01', periods=400)
+    returns = rng.normal([0.0008, 0.0004, 0.0002], [0.02, 0.012, 0.006], (400, 3))
+    return pd.DataFrame(returns, index=index, columns=[f"{t}_Daily_Return" for t in TICKERS])
+
+
+# Наивный walk-forward: моменты окна считаются заново на каждой ребалансировке,
+# стоимость портфеля (позиции в активах и деньги) пересчитывается день за днём
+def naive_walk_forward(port_df, target_volatility, optimize=optimize_portfolio_weights):
+    returns = port_df.to_numpy()
+    positions = [p for p in rebalance_positions(port_df.index) if WINDOW <= p + 1 < len(returns)]
+    value, holdings, guess = 1.0, np.zeros(3), np.full(3, 1 / 3)
+    values = {}
+    for day in range(positions[0], len(returns)):
+        if day > positions[0]:
+            assets = value * holdings * (1 + returns[day])
+            value = assets.sum() + value * (1 - holdings.sum())
+            holdings = assets / value
+        if day in positions:
+            window = returns[day + 1 - WINDOW:day + 1]
+            try:
+                target, _ = optimize(window.mean(axis=0), np.cov(window, rowvar=False),
+                                     target_volatility=target_volatility, init_guess=guess)
+                target = np.clip(target, 0, None) / np.clip(target, 0, None).sum()
+                guess = target
+            except ValueError:
+                target = holdings
+            value *= 1 - COST * np.abs(target - holdings).sum()
+            holdings = target
+        values[port_df.index[day]] = value
+    return pd.Series(values)
+
+
+def test_matches_naive_reference(port_df):
+    result = walk_forward_backtest(port_df, TICKERS, target_volatility=0.15, window=WINDOW, transaction_cost=COST)
+    expected = naive_walk_forward(port_df, 0.15)
+    pd.testing.assert_index_equal(result['values'].index, expected.index)
+    np.testing.assert_allclose(result['values'].to_numpy(), expected.to_numpy(), rtol=1e-6)
+    assert result['rebalances']['Success'].all()
+
+
+# Первая оптимизация не удалась: портфель остаётся в деньгах без сделок и издержек
+def test_first_failure_holds_cash(port_df, monkeypatch):
+    calls = []
+
+    def optimize(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("Оптимизация не удалась")
+        return optimize_portfolio_weights(*args, **kwargs)
+
+    monkeypatch.setattr(walk_forward, 'optimize_portfolio_weights', optimize)
+    result = walk_forward_backtest(port_df, TICKERS, target_volatility=0.15, window=WINDOW, transaction_cost=COST)
+    log = result['rebalances']
+    assert not log['Success'].iloc[0]
+    assert log['Turnover'].iloc[0] == 0
+    assert (result['weights'].iloc[0] == 0).all()
+
+    second = log['Date'].iloc[1]
+    assert (result['values'][result['values'].index < second] == 1.0).all()
+
+    calls.clear()
+    expected = naive_walk_forward(port_df, 0.15, optimize=optimize)
+    np.testing.assert_allclose(result['values'].to_numpy(), expected.to_numpy(), rtol=1e-6)
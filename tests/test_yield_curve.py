@@ -0,0 +1,76 @@
+import datetime as dt
+
+import pytest
+
+from loaders import yield_curve
+
+TODAY = dt.date.today()
+
+
+# Ответ ISS zcyc на дату: кривая есть только на даты из curves
+@pytest.fixture
+def zcyc(monkeypatch):
+    curves = {}
+    calls = []
+
+    def get_rf_moex(date, engine='stock'):
+        calls.append(dt.date.fromisoformat(str(date)))
+        return {'yearyields': {'columns': ['tradedate', 'period', 'value'],
+                               'data': [[str(date), p, v] for p, v in curves.get(str(date), [])]}}
+
+    monkeypatch.setattr(yield_curve, 'get_rf_moex', get_rf_moex)
+    yield_curve.clear_yield_cache()
+    yield curves, calls
+    yield_curve.clear_yield_cache()
+
+
+def test_null_values_are_skipped(zcyc):
+    curves, _ = zcyc
+    curves['2020-03-02'] = [[0.25, 5.0], [1.0, None], [2.0, 6.0]]
+    curve = yield_curve.fetch_yield_curve('2020-03-02')
+    assert curve.index.tolist() == [0.25, 2.0]
+    assert curve.tolist() == pytest.approx([0.05, 0.06])
+
+
+# Воскресенье давно прошедшей недели: кривая пятницы находится один раз, и после
+# очистки памяти (перезапуска) ни выходные, ни пятница из сети не запрашиваются
+def test_resolved_fallback_date_is_persisted(zcyc):
+    curves, calls = zcyc
+    curves['2020-03-06'] = [[1.0, 5.5]]
+    sunday = dt.date(2020, 3, 8)
+
+    assert yield_curve.get_yield_curve(sunday).tolist() == [0.055]
+    assert calls == [sunday, dt.date(2020, 3, 7), dt.date(2020, 3, 6)]
+
+    yield_curve.clear_yield_cache()
+    calls.clear()
+    assert yield_curve.get_yield_curve(sunday).tolist() == [0.055]
+    assert calls == []
+
+
+# Недавние даты (не старше FALLBACK_DAYS) не запоминаются в SQLite: кривая могла ещё не выйти
+def test_recent_fallback_is_not_persisted(zcyc):
+    curves, calls = zcyc
+    day = TODAY - dt.timedelta(days=2)
+    curves[(day - dt.timedelta(days=1)).isoformat()] = [[1.0, 7.0]]
+    yield_curve.get_yield_curve(day)
+
+    yield_curve.clear_yield_cache()
+    calls.clear()
+    yield_curve.get_yield_curve(day)
+    assert calls == [day]
+
+
+def test_today_curve_expires(zcyc, monkeypatch):
+    curves, calls = zcyc
+    curves[TODAY.isoformat()] = [[1.0, 8.0]]
+    yield_curve.get_yield_curve(TODAY)
+    yield_curve.get_yield_curve(TODAY)
+    assert calls == [TODAY]
+
+    curves[TODAY.isoformat()] = [[1.0, 9.0]]
+    monkeypatch.setattr(yield_curve, 'TODAY_TTL', 0.0)
+    yield_curve.clear_yield_cache()
+    yield_curve.get_yield_curve(TODAY)
+    assert yield_curve.get_yield_curve(TODAY).tolist() == [0.09]
+    assert calls == [TODAY, TODAY, TODAY]